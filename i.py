@@ -22,35 +22,149 @@ import time
 import re
 import shutil
 import socket
-import random
 import json
 import hashlib
+import sqlite3
+import tempfile
+import itertools
+import heapq
+import gzip
+import io
+import calendar
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape, quoteattr
 import atexit
 import threading
 import subprocess
-from urllib.parse import urlparse
-from concurrent.futures import ThreadPoolExecutor
+import urllib.request
+from urllib.parse import urlparse, urljoin
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # --- CONFIG ---
 UPDATE_INTERVAL = 18
 FETCH_TIMEOUT = 8
 VALIDATE_TIMEOUT = 6
+DNS_CACHE_TTL = 300
+DNS_NEGATIVE_TTL = 120
+DNS_CACHE_SIZE = 8192
 MAX_CONCURRENT_FETCHES = 60
 MAX_VALIDATION_THREADS = 12
 CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".vengatesh_iptv_v22")
 PLAYLIST_FILE = os.path.join(CONFIG_DIR, "github_aware_playlist.m3u")
 PERSISTENCE_FILE = os.path.join(CONFIG_DIR, "validated_github.json")
-TEMP_DIR = os.path.join(CONFIG_DIR, "temp_repos")
+MIRROR_DIR = os.path.join(CONFIG_DIR, "git_mirrors")
+MIRROR_FETCH_INTERVAL = 5 * 60
+MIRROR_PATTERNS = ("*.m3u", "*.m3u8", "*.txt")
+GIT_TIMEOUT = 60
+STATE_DB = os.path.join(CONFIG_DIR, "iptv_state.db")
+SOURCE_CACHE_MAX_AGE = 6 * 3600
+STREAM_CHUNK_SIZE = 64 * 1024
+SOURCE_SPOOL_BYTES = 1 << 20
+PLAYLIST_FLUSH_SECONDS = 2.0
+PLAYLIST_FLUSH_BATCH = 200
+PLAYLIST_MAX_AGE = 15
+PLAYLIST_SNAPSHOT_INTERVAL = 5.0
+EPG_REFRESH_INTERVAL = 3 * 3600
+EPG_FETCH_TIMEOUT = 300
+EPG_CONCURRENCY = 4
+EPG_BATCH = 2000
+EPG_RETENTION = 6 * 3600
+EPG_HORIZON = 2 * 24 * 3600
+EPG_SUBSET_HOURS = 24
+EPG_SUBSET_MIN_AGE = 60
+EPG_SUBSET_INTERVAL = 15 * 60
+EPG_MAX_AGE = 15 * 60
+PROXY_CHECK_URL = "http://www.gstatic.com/generate_204"
+PROXY_CHECK_INTERVAL = 10 * 60
+PROXY_CHECK_TIMEOUT = 5
+PROXY_DEAD_AFTER = 3
+PROXY_ATTEMPTS = 2
+PROXY_ROUTE_TTL = 30 * 24 * 3600
 os.makedirs(CONFIG_DIR, exist_ok=True)
-os.makedirs(TEMP_DIR, exist_ok=True)
+# Clones from before the persistent mirrors; nothing uses them any more.
+shutil.rmtree(os.path.join(CONFIG_DIR, "temp_repos"), ignore_errors=True)
+os.makedirs(MIRROR_DIR, exist_ok=True)
+
+# --- URL SET ---
+class UrlHashSet:
+    """Membership-only URL set: 64-bit blake2b hashes in a sorted array('Q'), 8 bytes per URL.
+
+    The URL strings themselves stay on disk (playlist / DB). Recent additions sit in a small
+    set and are merged into the sorted array every MERGE_AT adds. A false positive needs a
+    64-bit hash collision (~n^2 / 2^65, i.e. about 3e-8 at a million URLs).
+    """
+    MERGE_AT = 1 << 15
+
+    def __init__(self, urls=()):
+        self._sorted = array("Q")
+        self._recent = set()
+        self._lock = threading.Lock()
+        self.update(urls)
+
+    @staticmethod
+    def hash(url):
+        return int.from_bytes(hashlib.blake2b(url.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little")
+
+    def _has(self, h):
+        if h in self._recent:
+            return True
+        i = bisect_left(self._sorted, h)
+        return i < len(self._sorted) and self._sorted[i] == h
+
+    def _merge(self, extra=()):
+        # Both inputs are sorted, so one linear merge; groupby drops duplicates.
+        merged = heapq.merge(self._sorted, sorted(self._recent), extra)
+        self._sorted = array("Q", (h for h, _ in itertools.groupby(merged)))
+        self._recent = set()
+
+    def __contains__(self, url):
+        h = self.hash(url)
+        with self._lock:
+            return self._has(h)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sorted) + len(self._recent)
+
+    def add(self, url):
+        """Returns True if url was not in the set yet."""
+        h = self.hash(url)
+        with self._lock:
+            if self._has(h):
+                return False
+            self._recent.add(h)
+            if len(self._recent) >= self.MERGE_AT:
+                self._merge()
+            return True
+
+    def update(self, urls):
+        """Bulk load: hash everything, sort once, merge once."""
+        hashes = sorted(map(self.hash, urls))
+        if hashes:
+            with self._lock:
+                self._merge(hashes)
 
 # --- GLOBAL STATE ---
-accumulated_lock = threading.RLock()
-global_accumulated = {}
+# Membership only; the #EXTINF lines live in PLAYLIST_FILE.
+global_accumulated = UrlHashSet()
 global_total = 0
 cloudflare_url = None
 cloudflare_ready = asyncio.Event()
-playlist_update_lock = asyncio.Lock()
+dynamic_sources = set()
+playlist_snapshot = None
+snapshot_lock = asyncio.Lock()
+epg_version = 0
+epg_snapshot = None
+epg_snapshot_lock = asyncio.Lock()
 
 # --- PROXIES ---
 FREE_PROXIES = [
@@ -194,32 +308,122 @@ ALL_SOURCES = [
 
 # --- PERSISTENCE ---
 def load_persistence():
-    global global_accumulated, global_total
-    if os.path.exists(PERSISTENCE_FILE):
-        try:
+    """Rebuild global_accumulated from PLAYLIST_FILE; the legacy JSON is only imported when there is no playlist yet."""
+    global global_total
+    try:
+        if os.path.exists(PLAYLIST_FILE):
+            with open(PLAYLIST_FILE, "rb") as f:
+                global_accumulated.update(e.url for e in iter_m3u_entries(iter_file_chunks(f)))
+        elif os.path.exists(PERSISTENCE_FILE):
             with open(PERSISTENCE_FILE, "r", encoding="utf-8") as f:
                 data = json.load(f)
-                global_accumulated = {item["url"]: item["info"] for item in data.get("validated", [])}
-                global_total = len(global_accumulated)
-                print(f"✅ Loaded {global_total:,} channels.")
-        except Exception as e:
-            print(f"⚠️  Load failed: {e}")
+            for item in data.get("validated", []):
+                if global_accumulated.add(item["url"]):
+                    playlist_writer.add(item["url"], item["info"])
+        global_total = len(global_accumulated)
+        print(f"✅ Loaded {global_total:,} channels.")
+    except Exception as e:
+        print(f"⚠️  Load failed: {e}")
 
 def save_persistence_at_exit():
-    global global_accumulated
     try:
-        data = {
-            "total_validated": len(global_accumulated),
-            "validated": [{"url": url, "info": info} for url, info in global_accumulated.items()]
-        }
-        with open(PERSISTENCE_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
-        print(f"\n💾 Final persistence saved: {len(global_accumulated):,} channels.")
+        playlist_writer.flush()
+        print(f"\n💾 Final playlist saved: {len(global_accumulated):,} channels.")
     except Exception as e:
         print(f"\n❌ Save failed: {e}")
 
 atexit.register(save_persistence_at_exit)
 
+# --- DNS CACHE ---
+class DnsCache:
+    """getaddrinfo with a shared cache: answers are kept DNS_CACHE_TTL, failures (NXDOMAIN and
+    friends) DNS_NEGATIVE_TTL, and concurrent lookups of one name wait on a single resolution.
+
+    getaddrinfo does not expose record TTLs, so the TTLs are fixed.
+    """
+    def __init__(self, ttl=DNS_CACHE_TTL, negative_ttl=DNS_NEGATIVE_TTL, size=DNS_CACHE_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.size = size
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "lookups": 0, "negative": 0}
+
+    @staticmethod
+    def _answer(value):
+        if isinstance(value, socket.gaierror):
+            raise socket.gaierror(*value.args)
+        return list(value)
+
+    def _cached(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry
+
+    def cached(self, host, port=0, family=0, type=0, proto=0, flags=0):
+        """The cached answer, without resolving; None on a miss, raises on a cached failure."""
+        with self._lock:
+            entry = self._cached((host, port, family, type, proto, flags))
+        return None if entry is None else self._answer(entry[1])
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        key = (host, port, family, type, proto, flags)
+        with self._lock:
+            entry = self._cached(key)
+            if entry is not None:
+                return self._answer(entry[1])
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                self._inflight[key] = future = Future()
+        if waiter is not None:
+            return self._answer(waiter.result())
+        try:
+            value, ttl = _system_getaddrinfo(host, port, family, type, proto, flags), self.ttl
+        except socket.gaierror as e:
+            value, ttl = e, self.negative_ttl
+        except BaseException as e:
+            # Anything else (interrupted, out of fds) is not an answer about the name: not cached.
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self.stats["lookups"] += 1
+            self.stats["negative"] += isinstance(value, socket.gaierror)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+            del self._inflight[key]
+        future.set_result(value)
+        return self._answer(value)
+
+_system_getaddrinfo = socket.getaddrinfo
+DNS_CACHE = DnsCache()
+
+def install_dns_cache():
+    # requests/urllib3 and urllib all resolve through socket.getaddrinfo at call time.
+    socket.getaddrinfo = DNS_CACHE.getaddrinfo
+
+class CachedResolver(aiohttp.abc.AbstractResolver):
+    """aiohttp resolver on DNS_CACHE: hits are answered inline, misses resolve once in the default executor."""
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        infos = DNS_CACHE.cached(host, port, family, socket.SOCK_STREAM)
+        if infos is None:
+            infos = await asyncio.get_running_loop().run_in_executor(None, DNS_CACHE.getaddrinfo, host, port, family, socket.SOCK_STREAM)
+        return [{"hostname": host, "host": address[0], "port": address[1], "family": af, "proto": proto,
+                 "flags": socket.AI_NUMERICHOST | socket.AI_NUMERICSERV}
+                for af, _, proto, _, address in infos if af in (socket.AF_INET, socket.AF_INET6)]
+
+    async def close(self):
+        pass
+
 # --- UTILS ---
 def get_local_ip():
     try:
@@ -246,89 +450,631 @@ def extract_channel_name(info_line):
 def is_github_repo(url):
     return url.strip().endswith('.git') and 'github.com' in url
 
-def clone_github_repo(url):
-    """Synchronous clone — NO async here."""
+def git(dest, *args):
+    return subprocess.run(["git", "-C", dest, *args], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=GIT_TIMEOUT)
+
+def _init_mirror(url, dest):
+    # Blobless, shallow, sparse: only trees come down up front, and only playlist files are ever checked out.
+    if os.path.exists(dest):
+        shutil.rmtree(dest)
+    result = subprocess.run(["git", "clone", "--depth=1", "--filter=blob:none", "--no-checkout", url, dest],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=GIT_TIMEOUT)
+    if result.returncode != 0:
+        return False
+    git(dest, "config", "core.sparseCheckout", "true")
+    with open(os.path.join(dest, ".git", "info", "sparse-checkout"), "w") as f:
+        f.write("\n".join(MIRROR_PATTERNS) + "\n")
+    return git(dest, "checkout", "-q", "HEAD").returncode == 0
+
+def _playlist_blobs(dest):
+    """{path: blob sha} of the playlist files at HEAD, read from the tree objects alone."""
+    out = git(dest, "ls-tree", "-r", "-z", "HEAD").stdout
+    blobs = {}
+    for record in out.split(b"\0"):
+        meta, _, path = record.partition(b"\t")
+        parts = meta.split()
+        if len(parts) == 3 and parts[1] == b"blob" and path.lower().endswith((b".m3u", b".m3u8", b".txt")):
+            blobs[path.decode("utf-8", "surrogateescape")] = parts[2].decode()
+    return blobs
+
+def sync_github_mirror(url):
+    """Bring the persistent mirror of `url` up to date and return the playlist files that changed.
+
+    Mirrors live in MIRROR_DIR across cycles and restarts. The remote is asked for news at most
+    every MIRROR_FETCH_INTERVAL, and a file is only handed back when its blob sha differs from
+    the last cycle's (or all of them once the last parse is older than SOURCE_CACHE_MAX_AGE,
+    so failed candidates get another look, as with the raw sources).
+    """
+    now = int(time.time())
+    dest = os.path.join(MIRROR_DIR, hashlib.md5(url.encode()).hexdigest()[:10])
     try:
-        repo_name = hashlib.md5(url.encode()).hexdigest()[:10]
-        dest = os.path.join(TEMP_DIR, repo_name)
-        if os.path.exists(dest):
-            shutil.rmtree(dest)
-        result = subprocess.run(
-            ["git", "clone", "--depth=1", url, dest],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            timeout=60
-        )
-        if result.returncode == 0:
-            m3u_files = []
-            for root, _, files in os.walk(dest):
-                for f in files:
-                    if f.endswith(('.m3u', '.m3u8', '.txt')):
-                        m3u_files.append(os.path.join(root, f))
-            return m3u_files
+        conn = open_state_db()
+        try:
+            row = conn.execute("SELECT head, last_fetched, last_parsed FROM repo_mirrors WHERE url = ?", (url,)).fetchone()
+            known = dict(conn.execute("SELECT path, blob FROM repo_blobs WHERE url = ?", (url,)).fetchall())
+        finally:
+            conn.close()
+        head, last_fetched, last_parsed = row or (None, 0, 0)
+        if not os.path.isdir(os.path.join(dest, ".git")):
+            if not _init_mirror(url, dest):
+                return []
+            head, known, last_fetched = None, {}, now
+        elif now - (last_fetched or 0) >= MIRROR_FETCH_INTERVAL:
+            if git(dest, "fetch", "-q", "--depth=1", "origin", "HEAD").returncode != 0:
+                return []
+            git(dest, "reset", "-q", "--hard", "FETCH_HEAD")
+            last_fetched = now
+        current = git(dest, "rev-parse", "HEAD").stdout.decode().strip()
+        stale = now - (last_parsed or 0) >= SOURCE_CACHE_MAX_AGE
+        if current == head and not stale:
+            changed = []
+            blobs = known
+        else:
+            blobs = _playlist_blobs(dest)
+            changed = [path for path, blob in blobs.items() if stale or known.get(path) != blob]
+            last_parsed = now if changed or stale else last_parsed
+        conn = open_state_db()
+        try:
+            conn.execute("INSERT OR REPLACE INTO repo_mirrors(url, head, last_fetched, last_parsed) VALUES (?,?,?,?)", (url, current, last_fetched, last_parsed))
+            if blobs is not known:
+                conn.execute("DELETE FROM repo_blobs WHERE url = ?", (url,))
+                conn.executemany("INSERT INTO repo_blobs(url, path, blob) VALUES (?,?,?)", ((url, path, blob) for path, blob in blobs.items()))
+            conn.commit()
+        finally:
+            conn.close()
+        return [os.path.join(dest, path) for path in changed if os.path.isfile(os.path.join(dest, path))]
     except Exception:
-        pass
-    return []
+        return []
+
+# --- PARSING ---
+# One match per entry: an optional #EXTINF line, any directive/blank lines, then the URL line.
+_M3U_ENTRY_RE = re.compile(rb'^(?:#EXTINF:([^\n]*)\n(?:[ \t\r]*(?:#(?!EXTINF)[^\n]*)?\n)*)?[ \t]*([^#\s][^\r\n]*)', re.M)
+_HREF_M3U_RE = re.compile(rb'href=[\'"]([^\'"]*\.(?:m3u|m3u8))[\'"]')
+_MAX_CARRY_BYTES = 1 << 20
+_URL_SCHEMES = ("http://", "https://", "rtmp://", "rtmps://", "rtsp://", "rtp://", "udp://", "mms://")
 
-def read_local_playlist(path):
+class M3UEntry:
+    """One playlist entry: url plus #EXTINF fields, parsed on first access."""
+    __slots__ = ("url", "_info", "_meta")
+
+    def __init__(self, url, info=b""):
+        self.url = url
+        self._info = info
+        self._meta = None
+
+    def _fields(self):
+        if self._meta is None:
+            self._meta = _parse_extinf(self._info)
+        return self._meta
+
+    info = property(lambda self: self._info.decode("utf-8", "replace"))
+    name = property(lambda self: self._fields()[0])
+    tvg_id = property(lambda self: self._fields()[1])
+    tvg_logo = property(lambda self: self._fields()[2])
+    group_title = property(lambda self: self._fields()[3])
+    duration = property(lambda self: self._fields()[4])
+
+def _parse_extinf(info):
+    parts = info.split(b'"')
+    tvg_id = tvg_logo = group = None
+    for i in range(1, len(parts) - 1, 2):
+        key = parts[i - 1]
+        if key.endswith(b"tvg-id="):
+            tvg_id = parts[i].decode("utf-8", "replace") or None
+        elif key.endswith(b"tvg-logo="):
+            tvg_logo = parts[i].decode("utf-8", "replace") or None
+        elif key.endswith(b"group-title="):
+            group = parts[i].decode("utf-8", "replace") or None
+    # The title follows the first comma after the last quoted attribute.
+    tail = parts[-1]
+    comma = tail.find(b",")
+    name = tail[comma + 1:].strip().decode("utf-8", "replace") or None if comma >= 0 else None
+    head = parts[0].split(b",", 1)[0].split(None, 1)
     try:
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read()
-    except Exception:
-        return ""
+        duration = float(head[0]) if head else -1.0
+    except ValueError:
+        duration = -1.0
+    return name, tvg_id, tvg_logo, group, duration
+
+def iter_file_chunks(f, size=STREAM_CHUNK_SIZE):
+    return iter(lambda: f.read(size), b"")
+
+def _split_complete(buf):
+    """Split buf after its last URL line, so a trailing #EXTINF waits for its URL."""
+    end = buf.rfind(b"\n")
+    while end >= 0:
+        start = buf.rfind(b"\n", 0, end) + 1
+        line = buf[start:end].strip()
+        if line and line[0] != 35:  # not "#"
+            return buf[:end + 1], buf[end + 1:]
+        end = start - 1
+    return b"", buf
+
+def iter_m3u_entries(chunks, base_url="", scan_hrefs=False):
+    """Stream M3UEntry records out of an iterable of bytes chunks.
+
+    Entries are paired by one regex pass per chunk instead of a Python loop
+    per line, and only the unfinished tail is carried into the next chunk,
+    so memory stays flat for any playlist size. Relative URLs are resolved
+    against base_url; with scan_hrefs, href="...m3u" links in HTML pages
+    are yielded too.
+    """
+    carry = b""
+    for chunk in itertools.chain(chunks, (None,)):
+        if chunk is None:
+            region, carry = carry + b"\n", b""
+        elif not chunk:
+            continue
+        else:
+            region, carry = _split_complete(carry + chunk)
+            if len(carry) > _MAX_CARRY_BYTES:
+                carry = b""
+        for info, raw in _M3U_ENTRY_RE.findall(region):
+            if scan_hrefs and b"href=" in raw:
+                for href in _HREF_M3U_RE.findall(raw):
+                    yield M3UEntry(urljoin(base_url, href.decode("utf-8", "replace")))
+                continue
+            url = raw.decode("utf-8", "replace").rstrip()
+            if "://" in url:
+                # Scheme first: skips HTML/markdown/JS lines that merely contain a link.
+                if not url.lower().startswith(_URL_SCHEMES):
+                    continue
+            elif not base_url or " " in url or "<" in url:
+                continue
+            else:
+                url = urljoin(base_url, url)
+            yield M3UEntry(url, info)
+
+def format_extinf(entry):
+    attrs = "".join(f' {key}="{value}"' for key, value in (("tvg-id", entry.tvg_id), ("tvg-logo", entry.tvg_logo), ("group-title", entry.group_title)) if value)
+    return f"#EXTINF:{entry.duration:g}{attrs},{entry.name or entry.url}"
+
+def collect_candidates(contents):
+    """Parse fetched bodies / cloned files into (url, #EXTINF line) pairs not yet accumulated.
+
+    Only URLs under an #EXTINF line count: bare links in READMEs, licences and .txt notes are not streams.
+    """
+    candidates = []
+    seen = set()
+    for item in contents:
+        try:
+            body = open(item, "rb") if isinstance(item, str) else item
+        except OSError:
+            continue
+        with body:
+            for entry in iter_m3u_entries(iter_file_chunks(body)):
+                url = entry.url
+                if entry.info and url.startswith(('http', 'rtmp')) and url not in global_accumulated and url not in seen:
+                    seen.add(url)
+                    candidates.append((url, format_extinf(entry)))
+    return candidates
+
+# --- SOURCE CACHE ---
+def open_state_db():
+    conn = sqlite3.connect(STATE_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS source_cache (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            body_hash TEXT,
+            last_fetched INTEGER,
+            last_parsed INTEGER
+        );
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS epg_channels (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            icon TEXT,
+            source TEXT
+        );
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS programmes (
+            channel TEXT NOT NULL,
+            start INTEGER NOT NULL,
+            stop INTEGER NOT NULL,
+            title TEXT,
+            descr TEXT,
+            source TEXT,
+            PRIMARY KEY (channel, start)
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_programmes_stop ON programmes(stop)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS repo_mirrors (
+            url TEXT PRIMARY KEY,
+            head TEXT,
+            last_fetched INTEGER,
+            last_parsed INTEGER
+        );
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS repo_blobs (
+            url TEXT NOT NULL,
+            path TEXT NOT NULL,
+            blob TEXT NOT NULL,
+            PRIMARY KEY (url, path)
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS proxies (
+            host TEXT NOT NULL,
+            port INTEGER NOT NULL,
+            checks INTEGER,
+            ok_rate REAL,
+            latency_ms REAL,
+            fail_streak INTEGER,
+            last_checked INTEGER,
+            PRIMARY KEY (host, port)
+        );
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS proxy_routes (
+            key TEXT PRIMARY KEY,
+            host TEXT,
+            port INTEGER,
+            last_ok INTEGER
+        );
+    """)
+    return conn
+
+def load_source_cache():
+    try:
+        conn = open_state_db()
+        try:
+            rows = conn.execute("SELECT url, etag, last_modified, body_hash, last_fetched, last_parsed FROM source_cache").fetchall()
+        finally:
+            conn.close()
+        return {url: {"etag": etag, "last_modified": lm, "body_hash": h, "last_fetched": lf, "last_parsed": lp}
+                for url, etag, lm, h, lf, lp in rows}
+    except Exception as e:
+        print(f"⚠️  Source cache load failed: {e}")
+        return {}
+
+def save_source_cache(cache):
+    rows = [(url, e.get("etag"), e.get("last_modified"), e.get("body_hash"), e.get("last_fetched"), e.get("last_parsed"))
+            for url, e in list(cache.items())]
+    try:
+        conn = open_state_db()
+        try:
+            conn.executemany("INSERT OR REPLACE INTO source_cache(url, etag, last_modified, body_hash, last_fetched, last_parsed) VALUES (?,?,?,?,?,?)", rows)
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"⚠️  Source cache save failed: {e}")
 
 # --- FETCHING (ASYNC) ---
-async def fetch_url(session, url):
+async def fetch_url_conditional(session, url, cache, force=False, timeout=FETCH_TIMEOUT):
+    """Returns the body as a spooled file (caller closes), or None when unreachable or unchanged since the last parse."""
+    url = url.strip()
+    now = int(time.time())
+    entry = cache.get(url) or {}
+    fresh = not force and now - (entry.get("last_parsed") or 0) < SOURCE_CACHE_MAX_AGE
+    headers = {'User-Agent': 'VengateshIPTV/22.1'}
+    if fresh and entry.get("etag"):
+        headers['If-None-Match'] = entry["etag"]
+    if fresh and entry.get("last_modified"):
+        headers['If-Modified-Since'] = entry["last_modified"]
+    body = tempfile.SpooledTemporaryFile(max_size=SOURCE_SPOOL_BYTES)
     try:
-        async with session.get(
-            url.strip(),
-            timeout=FETCH_TIMEOUT,
-            headers={'User-Agent': 'VengateshIPTV/22.1'}
-        ) as resp:
-            if resp.status == 200:
-                return await resp.text(encoding='utf-8', errors='ignore')
+        async with session.get(url, timeout=timeout, headers=headers) as resp:
+            if resp.status == 304:
+                cache[url] = dict(entry, last_fetched=now)
+            elif resp.status == 200:
+                hasher = hashlib.sha1()
+                async for chunk in resp.content.iter_chunked(STREAM_CHUNK_SIZE):
+                    hasher.update(chunk)
+                    body.write(chunk)
+                body_hash = hasher.hexdigest()
+                unchanged = fresh and body_hash == entry.get("body_hash")
+                cache[url] = {
+                    "etag": resp.headers.get("ETag"),
+                    "last_modified": resp.headers.get("Last-Modified"),
+                    "body_hash": body_hash,
+                    "last_fetched": now,
+                    "last_parsed": entry.get("last_parsed") if unchanged else now,
+                }
+                if not unchanged and body.tell():
+                    body.seek(0)
+                    return body
     except Exception:
         pass
-    return ""
+    body.close()
+    return None
+
+# --- PROXY POOL ---
+class ProxyPool:
+    """FREE_PROXIES with background health checks and a score per proxy.
+
+    Each proxy has its own opener (never installed globally), so concurrent validations
+    cannot swap each other's proxy. URLs that only validated through a proxy are
+    remembered, together with their host, so the next check goes straight to that proxy
+    (or the best live one if it has died since).
+    """
+    def __init__(self, proxies):
+        self.proxies = list(proxies)
+        self._lock = threading.Lock()
+        self._stats = {p: {"checks": 0, "ok_rate": 0.5, "latency_ms": 1000.0, "fail_streak": 0, "last_checked": 0} for p in self.proxies}
+        self._routes = {}
+        self._openers = {p: urllib.request.build_opener(urllib.request.ProxyHandler({"http": f"http://{p[0]}:{p[1]}", "https": f"http://{p[0]}:{p[1]}"}))
+                         for p in self.proxies}
+        self._openers[None] = urllib.request.build_opener()
+
+    def opener(self, proxy=None):
+        return self._openers[proxy]
+
+    def _alive(self, proxy):
+        return self._stats[proxy]["fail_streak"] < PROXY_DEAD_AFTER
+
+    def score(self, proxy):
+        s = self._stats[proxy]
+        return s["ok_rate"] / (1 + s["latency_ms"] / 1000) if self._alive(proxy) else 0.0
+
+    def ranked(self):
+        with self._lock:
+            return sorted((p for p in self.proxies if self._alive(p)), key=self.score, reverse=True)
+
+    def route(self, url):
+        """The proxy url (or its host) last validated through, or None; a dead one is swapped for the best live proxy."""
+        with self._lock:
+            route = self._routes.get(url) or self._routes.get(urlparse(url).netloc)
+            if route is None:
+                return None
+            if self._alive(route[0]):
+                return route[0]
+        ranked = self.ranked()
+        return ranked[0] if ranked else None
+
+    def remember(self, url, proxy):
+        now = int(time.time())
+        with self._lock:
+            self._routes[url] = self._routes[urlparse(url).netloc] = (proxy, now)
+
+    def forget(self, url):
+        with self._lock:
+            self._routes.pop(url, None)
+            self._routes.pop(urlparse(url).netloc, None)
+
+    def record(self, proxy, ok, latency_ms):
+        with self._lock:
+            s = self._stats[proxy]
+            s["checks"] += 1
+            s["ok_rate"] = 0.7 * s["ok_rate"] + 0.3 * ok
+            if ok:
+                s["latency_ms"] = 0.7 * s["latency_ms"] + 0.3 * latency_ms
+            s["fail_streak"] = 0 if ok else s["fail_streak"] + 1
+            s["last_checked"] = int(time.time())
+
+    def check(self, proxy):
+        started = time.monotonic()
+        try:
+            with self._openers[proxy].open(PROXY_CHECK_URL, timeout=PROXY_CHECK_TIMEOUT) as resp:
+                ok = resp.getcode() in (200, 204)
+        except Exception:
+            ok = False
+        self.record(proxy, ok, (time.monotonic() - started) * 1000)
+        return ok
+
+    def check_all(self):
+        with ThreadPoolExecutor(max_workers=min(len(self.proxies), 16) or 1) as executor:
+            alive = sum(executor.map(self.check, self.proxies))
+        self.save()
+        best = self.ranked()[:1]
+        print(f"🧦 Proxies: {alive}/{len(self.proxies)} alive" + (f", best {best[0][0]}:{best[0][1]}" if best else ""))
+
+    def load(self):
+        try:
+            conn = open_state_db()
+            try:
+                rows = conn.execute("SELECT host, port, checks, ok_rate, latency_ms, fail_streak, last_checked FROM proxies").fetchall()
+                routes = conn.execute("SELECT key, host, port, last_ok FROM proxy_routes WHERE last_ok >= ?", (int(time.time()) - PROXY_ROUTE_TTL,)).fetchall()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"⚠️  Proxy state load failed: {e}")
+            return
+        with self._lock:
+            for host, port, checks, ok_rate, latency_ms, fail_streak, last_checked in rows:
+                if (host, port) in self._stats:
+                    self._stats[(host, port)] = {"checks": checks, "ok_rate": ok_rate, "latency_ms": latency_ms, "fail_streak": fail_streak, "last_checked": last_checked}
+            for key, host, port, last_ok in routes:
+                if (host, port) in self._stats:
+                    self._routes[key] = ((host, port), last_ok)
+
+    def save(self):
+        with self._lock:
+            stats = [(p[0], p[1], s["checks"], s["ok_rate"], s["latency_ms"], s["fail_streak"], s["last_checked"]) for p, s in self._stats.items()]
+            routes = [(key, p[0], p[1], last_ok) for key, (p, last_ok) in self._routes.items()]
+        try:
+            conn = open_state_db()
+            try:
+                conn.executemany("INSERT OR REPLACE INTO proxies(host, port, checks, ok_rate, latency_ms, fail_streak, last_checked) VALUES (?,?,?,?,?,?,?)", stats)
+                conn.execute("DELETE FROM proxy_routes")
+                conn.executemany("INSERT INTO proxy_routes(key, host, port, last_ok) VALUES (?,?,?,?)", routes)
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"⚠️  Proxy state save failed: {e}")
+
+proxy_pool = ProxyPool(FREE_PROXIES)
+
+async def proxy_loop():
+    while True:
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, proxy_pool.check_all)
+        except Exception as e:
+            print(f"⚠️  Proxy check failed: {e}")
+        await asyncio.sleep(PROXY_CHECK_INTERVAL)
 
 # --- VALIDATION (SYNC, for thread pool) ---
-def validate_and_add(url, info, proxy_list, callback):
+def validate_and_add(url, info, pool, callback):
     if not url or not (url.startswith('http') or url.startswith('rtmp')):
         return
-    def try_proxy(proxy):
+    def attempt(proxy):
         try:
-            import urllib.request, socket
-            timeout = VALIDATE_TIMEOUT
             if url.startswith('rtmp'):
                 parsed = urlparse(url)
                 host, port = parsed.hostname or 'localhost', parsed.port or 1935
-                with socket.create_connection((host, port), timeout=timeout):
+                with socket.create_connection((host, port), timeout=VALIDATE_TIMEOUT):
                     return True
-            else:
-                req = urllib.request.Request(url)
-                req.add_header('Range', 'bytes=0-512')
-                req.add_header('User-Agent', 'VengateshIPTV/22.1')
-                if proxy:
-                    ph = urllib.request.ProxyHandler({'http': f'http://{proxy[0]}:{proxy[1]}', 'https': f'http://{proxy[0]}:{proxy[1]}'})
-                    opener = urllib.request.build_opener(ph)
-                    urllib.request.install_opener(opener)
-                with urllib.request.urlopen(req, timeout=timeout) as resp:
-                    return resp.getcode() in (200, 206)
+            req = urllib.request.Request(url, headers={'Range': 'bytes=0-512', 'User-Agent': 'VengateshIPTV/22.1'})
+            with pool.opener(proxy).open(req, timeout=VALIDATE_TIMEOUT) as resp:
+                return resp.getcode() in (200, 206)
         except Exception:
             return False
-    if try_proxy(None) or any(try_proxy(random.choice(proxy_list)) for _ in range(2)):
+    if url.startswith('rtmp'):
+        if attempt(None):
+            callback(url, info)
+        return
+    # Known proxy-only URLs (or hosts) go to their proxy first, everything else direct first.
+    route = pool.route(url)
+    if route and attempt(route):
+        pool.remember(url, route)
+        callback(url, info)
+        return
+    if attempt(None):
+        if route:
+            pool.forget(url)
         callback(url, info)
+        return
+    for proxy in [p for p in pool.ranked() if p != route][:PROXY_ATTEMPTS]:
+        if attempt(proxy):
+            pool.remember(url, proxy)
+            callback(url, info)
+            return
 
-async def write_playlist():
-    async with playlist_update_lock:
-        epg_str = ','.join(EPG_SOURCES)
-        header = f'#EXTM3U x-tvg-url="{epg_str}"\n'
-        body = "\n".join(f"{info}\n{url}" for url, info in global_accumulated.items())
-        with open(PLAYLIST_FILE, "w", encoding="utf-8") as f:
-            f.write(header + body)
+# --- PLAYLIST WRITER ---
+def public_base_url():
+    if cloudflare_url:
+        return cloudflare_url.rsplit("/", 1)[0]
+    return f"http://{get_local_ip()}:8080"
+
+def playlist_header():
+    # Players get our playlist-scoped guide instead of the full upstream EPG_SOURCES.
+    return f'#EXTM3U x-tvg-url="{public_base_url()}/epg.xml.gz"\n'
+
+class PlaylistWriter:
+    """Coalesces added entries into one write per window (or per batch).
+
+    New entries are appended; a changed header means a rewrite to a temp file + os.replace
+    that copies the existing entries across from the old file. `size` only ever covers
+    complete entries, so readers never see a half-written one.
+    """
+    def __init__(self, path, window=PLAYLIST_FLUSH_SECONDS, batch=PLAYLIST_FLUSH_BATCH):
+        self.path = path
+        self.window = window
+        self.batch = batch
+        self.size = 0
+        self.version = 0
+        self.mtime = 0.0
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._timer = None
+        self._entries = []
+        self._header = None
+
+    def add(self, url, info):
+        with self._lock:
+            self._entries.append((url, info))
+            self._kick()
+
+    def notify(self):
+        with self._lock:
+            self._kick()
+
+    def _kick(self):
+        if self._timer is None:
+            self._schedule(self.window)
+        elif len(self._entries) == self.batch:
+            self._timer.cancel()
+            self._schedule(0)
+
+    def _schedule(self, delay):
+        self._timer = threading.Timer(delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _copy_entries(self, dst):
+        """Copy the current file minus its header line into dst; returns bytes copied."""
+        try:
+            src = open(self.path, "rb")
+        except FileNotFoundError:
+            return 0
+        with src:
+            end = self.size or os.fstat(src.fileno()).st_size
+            tail = src.readline()
+            copied = 0
+            if not tail.startswith(b"#EXTM3U"):
+                dst.write(tail)
+                copied = len(tail)
+            remaining = end - src.tell()
+            while remaining > 0:
+                chunk = src.read(min(STREAM_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                dst.write(chunk)
+                tail = chunk
+                copied += len(chunk)
+                remaining -= len(chunk)
+            if copied and not tail.endswith(b"\n"):
+                dst.write(b"\n")
+                copied += 1
+        return copied
+
+    def flush(self):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            entries, self._entries = self._entries, []
+        with self._io_lock:
+            header = playlist_header()
+            rewrite = header != self._header or not os.path.exists(self.path)
+            if not rewrite and not entries:
+                return
+            data = "".join(f"{info}\n{url}\n" for url, info in entries).encode("utf-8")
+            try:
+                if rewrite:
+                    head = header.encode("utf-8")
+                    tmp = self.path + ".tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(head)
+                        copied = self._copy_entries(f)
+                        f.write(data)
+                    os.replace(tmp, self.path)
+                    self.size = len(head) + copied + len(data)
+                    self._header = header
+                else:
+                    with open(self.path, "ab") as f:
+                        f.write(data)
+                    self.size += len(data)
+                self.version += 1
+                self.mtime = time.time()
+            except OSError as e:
+                self._header = None
+                with self._lock:
+                    self._entries[:0] = entries
+                print(f"⚠️  Playlist write failed: {e}")
+
+    def read(self):
+        """Returns (body, version, mtime) of the last complete flush; body is None before the first one."""
+        with self._io_lock:
+            if not self.size:
+                return None, self.version, self.mtime
+            f = open(self.path, "rb")
+            size, version, mtime = self.size, self.version, self.mtime
+        with f:
+            return f.read(size), version, mtime
+
+playlist_writer = PlaylistWriter(PLAYLIST_FILE)
 
 # --- DISCOVERY ---
-async def discover_sources(session):
+async def discover_sources(session, cache):
     discovered = set()
     countries = ["in", "us", "uk", "ca", "au", "de", "fr", "es", "it", "br", "mx", "ru", "jp", "kr", "sa", "ae", "za"]
     languages = ["tam", "hin", "eng", "spa", "fra", "deu", "por", "ara", "rus", "jpn", "kor"]
@@ -338,19 +1084,20 @@ async def discover_sources(session):
         discovered.add(f"https://raw.githubusercontent.com/iptv-org/iptv/master/languages/{l}.m3u")
     for cat in ["news", "sports", "movies", "kids"]:
         discovered.add(f"https://raw.githubusercontent.com/iptv-org/iptv/master/categories/{cat}.m3u")
-    try:
-        async with session.get("https://iptv-org.github.io/iptv/index.m3u", timeout=10) as resp:
-            if resp.status == 200:
-                content = await resp.text()
-                for line in content.split('\n'):
-                    if line.startswith('http') and line.strip().endswith(('.m3u', '.m3u8')):
-                        discovered.add(line.strip())
-    except Exception:
-        pass
+    body = await fetch_url_conditional(session, "https://iptv-org.github.io/iptv/index.m3u", cache, force=not dynamic_sources)
+    if body:
+        def parse_index():
+            with body:
+                return {e.url for e in iter_m3u_entries(iter_file_chunks(body)) if e.url.startswith('http') and e.url.endswith(('.m3u', '.m3u8'))}
+        found = await asyncio.get_event_loop().run_in_executor(None, parse_index)
+        dynamic_sources.clear()
+        dynamic_sources.update(found)
+    discovered.update(dynamic_sources)
     return list(discovered)
 
 # --- MAIN FETCH PIPELINE ---
 async def fetch_all_sources():
+    """Returns (contents, source_cache); the caller saves the cache once the changed bodies are parsed."""
     github_repos = []
     direct_urls = []
 
@@ -361,31 +1108,181 @@ async def fetch_all_sources():
         else:
             direct_urls.append(clean)
 
-    # Clone GitHub repos (synchronous, in thread pool)
+    # Sync GitHub mirrors (synchronous, in thread pool)
     contents = []
     loop = asyncio.get_event_loop()
     for repo_url in github_repos:
-        print(f"📦 Cloning: {repo_url}")
-        m3u_paths = await loop.run_in_executor(None, clone_github_repo, repo_url)
-        for path in m3u_paths:
-            content = await loop.run_in_executor(None, read_local_playlist, path)
-            if content:
-                contents.append(content)
+        m3u_paths = await loop.run_in_executor(None, sync_github_mirror, repo_url)
+        if m3u_paths:
+            print(f"📦 {repo_url}: {len(m3u_paths)} changed playlist files")
+        contents.extend(m3u_paths)
 
     # Discover dynamic sources
-    async with aiohttp.ClientSession() as session:
-        dynamic_sources = await discover_sources(session)
-        direct_urls.extend(dynamic_sources)
+    source_cache = await loop.run_in_executor(None, load_source_cache)
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(resolver=CachedResolver())) as session:
+        direct_urls.extend(await discover_sources(session, source_cache))
 
-        # Fetch direct URLs
+        # Fetch direct URLs (unchanged sources come back empty and are not re-parsed)
         semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
         async def limited_fetch(url):
             async with semaphore:
-                return await fetch_url(session, url)
+                return await fetch_url_conditional(session, url, source_cache)
         direct_contents = await asyncio.gather(*[limited_fetch(url) for url in direct_urls])
-        contents.extend([c for c in direct_contents if c])
+        changed = [c for c in direct_contents if c]
+        contents.extend(changed)
+    print(f"🗂️  Sources changed since last parse: {len(changed)}/{len(direct_urls)}")
 
-    return contents
+    return contents, source_cache
+
+# --- EPG ---
+def parse_xmltv_time(value):
+    # "20240101120000 +0530" -> epoch seconds; a missing offset means UTC.
+    value = (value or "").strip()
+    try:
+        ts = calendar.timegm((int(value[0:4]), int(value[4:6]), int(value[6:8]), int(value[8:10]), int(value[10:12]), int(value[12:14] or 0)))
+    except ValueError:
+        return None
+    offset = value[14:].strip()
+    if len(offset) == 5 and offset[0] in "+-" and offset[1:].isdigit():
+        seconds = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+        ts -= seconds if offset[0] == "+" else -seconds
+    return ts
+
+def format_xmltv_time(ts):
+    return time.strftime("%Y%m%d%H%M%S +0000", time.gmtime(ts))
+
+def ingest_xmltv(f, source, now=None):
+    """Stream XMLTV (plain or gzip) into epg_channels/programmes in EPG_BATCH commits; returns programmes kept."""
+    now = now or int(time.time())
+    if f.read(2) == b"\x1f\x8b":
+        f.seek(0)
+        f = gzip.GzipFile(fileobj=f)
+    else:
+        f.seek(0)
+    conn = open_state_db()
+    channels, programmes = [], []
+    total = 0
+    root = None
+    def commit():
+        conn.executemany("INSERT OR REPLACE INTO programmes(channel, start, stop, title, descr, source) VALUES (?,?,?,?,?,?)", programmes)
+        conn.executemany("INSERT OR REPLACE INTO epg_channels(id, name, icon, source) VALUES (?,?,?,?)", channels)
+        conn.commit()
+    try:
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag == "programme":
+                start, stop = parse_xmltv_time(elem.get("start")), parse_xmltv_time(elem.get("stop"))
+                channel = elem.get("channel")
+                if channel and start and (stop or start) >= now - EPG_RETENTION and start <= now + EPG_HORIZON:
+                    programmes.append((channel, start, stop or start, elem.findtext("title"), elem.findtext("desc"), source))
+            elif elem.tag == "channel":
+                icon = elem.find("icon")
+                channels.append((elem.get("id"), elem.findtext("display-name"), icon.get("src") if icon is not None else None, source))
+            else:
+                continue
+            root.clear()
+            if len(programmes) + len(channels) >= EPG_BATCH:
+                total += len(programmes)
+                commit()
+                channels, programmes = [], []
+        total += len(programmes)
+        commit()
+    finally:
+        conn.close()
+    return total
+
+def prune_programmes():
+    conn = open_state_db()
+    try:
+        conn.execute("DELETE FROM programmes WHERE stop < ?", (int(time.time()) - EPG_RETENTION,))
+        conn.commit()
+    finally:
+        conn.close()
+
+async def refresh_epg():
+    global epg_version
+    loop = asyncio.get_event_loop()
+    cache = await loop.run_in_executor(None, load_source_cache)
+    semaphore = asyncio.Semaphore(EPG_CONCURRENCY)
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(resolver=CachedResolver())) as session:
+        async def ingest(url):
+            # The guide's new ETag/body hash reach `cache` only once it is ingested, so a bad guide is retried.
+            # Parsing stays under the semaphore: EPG_CONCURRENCY bounds the ingest work, not just the fetches.
+            pending = {url: cache[url]} if url in cache else {}
+            async with semaphore:
+                body = await fetch_url_conditional(session, url, pending, timeout=EPG_FETCH_TIMEOUT)
+                if not body:
+                    cache.update(pending)
+                    return None
+                def run():
+                    with body:
+                        return ingest_xmltv(body, url)
+                total = await loop.run_in_executor(None, run)
+            cache.update(pending)
+            return total
+        results = await asyncio.gather(*[ingest(url) for url in EPG_SOURCES], return_exceptions=True)
+    await loop.run_in_executor(None, save_source_cache, cache)
+    await loop.run_in_executor(None, prune_programmes)
+    changed = [r for r in results if isinstance(r, int)]
+    if changed:
+        epg_version += 1
+    print(f"📺 EPG: {len(changed)}/{len(EPG_SOURCES)} guides changed, {sum(changed):,} programmes ingested")
+
+async def epg_loop():
+    while True:
+        try:
+            await refresh_epg()
+        except Exception as e:
+            print(f"⚠️  EPG refresh failed: {e}")
+        await asyncio.sleep(EPG_REFRESH_INTERVAL)
+
+def normalize_name(name):
+    name = re.sub(r'[\(\[][^\)\]]*[\)\]]', ' ', (name or "").lower())
+    return " ".join(re.findall(r'[a-z0-9]+', name))
+
+def build_epg_subset(now=None, hours=EPG_SUBSET_HOURS):
+    """Gzipped XMLTV for just the playlist's channels (by tvg-id, else by name), next `hours` only.
+
+    Returns (body, channels matched).
+    """
+    now = now or int(time.time())
+    ids, names = set(), set()
+    try:
+        with open(PLAYLIST_FILE, "rb") as f:
+            for entry in iter_m3u_entries(iter_file_chunks(f)):
+                if entry.tvg_id:
+                    ids.add(entry.tvg_id)
+                else:
+                    names.add(normalize_name(entry.name))
+    except FileNotFoundError:
+        pass
+    names.discard("")
+    buf = io.BytesIO()
+    conn = open_state_db()
+    try:
+        channels = {cid: (name, icon) for cid, name, icon in conn.execute("SELECT id, name, icon FROM epg_channels")
+                    if cid in ids or normalize_name(name) in names}
+        with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=6, mtime=0) as out:
+            out.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="VengateshIPTV">\n')
+            for cid, (name, icon) in channels.items():
+                icon_tag = f"<icon src={quoteattr(icon)}/>" if icon else ""
+                out.write(f'<channel id={quoteattr(cid)}><display-name>{escape(name or cid)}</display-name>{icon_tag}</channel>\n'.encode("utf-8"))
+            cids = list(channels)
+            for i in range(0, len(cids), 500):
+                chunk = cids[i:i + 500]
+                rows = conn.execute(f"SELECT channel, start, stop, title, descr FROM programmes WHERE channel IN ({','.join('?' * len(chunk))}) AND stop > ? AND start < ?",
+                                    chunk + [now, now + hours * 3600])
+                for channel, start, stop, title, descr in rows:
+                    desc_tag = f"<desc>{escape(descr)}</desc>" if descr else ""
+                    out.write(f'<programme start="{format_xmltv_time(start)}" stop="{format_xmltv_time(stop)}" channel={quoteattr(channel)}>'
+                              f'<title>{escape(title or "")}</title>{desc_tag}</programme>\n'.encode("utf-8"))
+            out.write(b"</tv>\n")
+    finally:
+        conn.close()
+    return buf.getvalue(), len(channels)
 
 # --- CLOUDFLARE ---
 async def start_cloudflared_early():
@@ -407,6 +1304,7 @@ async def start_cloudflared_early():
             match = re.search(r'https://[a-z0-9-]+\.trycloudflare\.com', text)
             if match:
                 cloudflare_url = f"{match.group(0)}/playlist.m3u"
+                playlist_writer.notify()
                 print("\n" + "🌍" * 30)
                 print(f"✅ CLOUDFLARE URL: {cloudflare_url}")
                 print("🌍" * 30 + "\n")
@@ -416,53 +1314,186 @@ async def start_cloudflared_early():
 # --- REAL-TIME CYCLE ---
 async def run_github_cycle():
     global global_total
-    print("📥 Fetching sources (cloning GitHub repos + downloading raw URLs)...")
-    contents = await fetch_all_sources()
-
-    candidate_streams = []
-    for content in contents:
-        lines = content.strip().split('\n')
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            if line.startswith('#EXTINF:'):
-                if i + 1 < len(lines):
-                    url = lines[i+1].strip()
-                    if url and (url.startswith('http') or url.startswith('rtmp')):
-                        if url not in global_accumulated:
-                            candidate_streams.append((url, line))
-                i += 2
-                continue
-            i += 1
+    print("📥 Fetching sources (syncing GitHub mirrors + downloading raw URLs)...")
+    contents, source_cache = await fetch_all_sources()
+
+    candidate_streams = await asyncio.get_event_loop().run_in_executor(None, collect_candidates, contents)
+    # Only now are the changed bodies parsed; saved earlier, a crash would leave them "unchanged".
+    await asyncio.get_event_loop().run_in_executor(None, save_source_cache, source_cache)
 
     print(f"🔍 Validating {len(candidate_streams)} streams (real-time)...")
 
     def on_valid(url, info):
         global global_total
-        with accumulated_lock:
-            if url not in global_accumulated:
-                global_accumulated[url] = info
-                global_total = len(global_accumulated)
-                asyncio.run_coroutine_threadsafe(write_playlist(), asyncio.get_event_loop())
-                print(f"✅ Added: {extract_channel_name(info)[:40]}... | Total: {global_total:,}")
-
-    with ThreadPoolExecutor(max_workers=MAX_VALIDATION_THREADS) as executor:
-        for url, info in candidate_streams:
-            executor.submit(validate_and_add, url, info, FREE_PROXIES, on_valid)
-
-    await write_playlist()
+        if global_accumulated.add(url):
+            playlist_writer.add(url, info)
+            global_total = len(global_accumulated)
+            print(f"✅ Added: {extract_channel_name(info)[:40]}... | Total: {global_total:,}")
+
+    def validate_all():
+        with ThreadPoolExecutor(max_workers=MAX_VALIDATION_THREADS) as executor:
+            for url, info in candidate_streams:
+                executor.submit(validate_and_add, url, info, proxy_pool, on_valid)
+
+    # Waited on from a worker thread so the server keeps answering during validation.
+    await asyncio.get_event_loop().run_in_executor(None, validate_all)
+
+    await asyncio.get_event_loop().run_in_executor(None, playlist_writer.flush)
+    await asyncio.get_event_loop().run_in_executor(None, proxy_pool.save)
     return global_total
 
 # --- SERVER ---
 from aiohttp import web
 
-async def serve_playlist(_):
-    return web.FileResponse(PLAYLIST_FILE) if os.path.exists(PLAYLIST_FILE) else web.Response(status=404)
+def build_playlist_snapshot():
+    body, version, mtime = playlist_writer.read()
+    snapshot = {"version": version, "built": time.monotonic(), "mtime": int(mtime), "bodies": {}, "etags": {}}
+    if body is None:
+        return snapshot
+    tag = hashlib.sha1(body).hexdigest()[:20]
+    snapshot["bodies"]["identity"] = body
+    snapshot["bodies"]["gzip"] = gzip.compress(body, compresslevel=6, mtime=0)
+    if brotli:
+        snapshot["bodies"]["br"] = brotli.compress(body, quality=5)
+    for encoding in snapshot["bodies"]:
+        snapshot["etags"][encoding] = f'"{tag}"' if encoding == "identity" else f'"{tag}-{encoding}"'
+    snapshot["last_modified"] = formatdate(snapshot["mtime"], usegmt=True)
+    return snapshot
+
+async def current_playlist_snapshot():
+    """Rebuilt off the loop when the writer has flushed since, at most every PLAYLIST_SNAPSHOT_INTERVAL; stale-while-rebuilding."""
+    global playlist_snapshot
+    snap = playlist_snapshot
+    if snap is not None and (snap["version"] == playlist_writer.version or snapshot_lock.locked()
+                             or time.monotonic() - snap["built"] < PLAYLIST_SNAPSHOT_INTERVAL):
+        return snap
+    async with snapshot_lock:
+        if playlist_snapshot is None or playlist_snapshot["version"] != playlist_writer.version:
+            playlist_snapshot = await asyncio.get_event_loop().run_in_executor(None, build_playlist_snapshot)
+        return playlist_snapshot
+
+def pick_encoding(accept, available):
+    accepted = {}
+    for part in accept.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                pass
+        accepted[name.strip()] = q
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return "identity"
+
+def parse_range(header, length):
+    """Single 'bytes=' range -> (start, end) inclusive; None to ignore (multi/malformed); False if unsatisfiable."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                return False
+            return max(0, length - suffix), length - 1
+        start = int(first)
+        end = min(int(last), length - 1) if last else length - 1
+    except ValueError:
+        return None
+    if start >= length or end < start:
+        return False
+    return start, end
+
+def not_modified(request, snap, etag):
+    # If-None-Match is checked against the ETag of the representation being served, not its siblings:
+    # a cached gzip body is no stand-in for a br or identity one.
+    inm = request.headers.get("If-None-Match")
+    if inm is not None:
+        tags = {t.strip()[2:] if t.strip().startswith("W/") else t.strip() for t in inm.split(",")}
+        return "*" in tags or etag in tags
+    ims = request.headers.get("If-Modified-Since")
+    if ims:
+        try:
+            return parsedate_to_datetime(ims).timestamp() >= snap["mtime"]
+        except (TypeError, ValueError):
+            pass
+    return False
+
+async def current_epg_snapshot():
+    """Rebuilt when the playlist or the ingested guides changed (at most every EPG_SUBSET_MIN_AGE), and every
+    EPG_SUBSET_INTERVAL as the window moves; an identical rebuild keeps its ETag/Last-Modified."""
+    global epg_snapshot
+    key = (playlist_writer.version, epg_version)
+    snap = epg_snapshot
+    if snap is not None:
+        age = time.monotonic() - snap["built"]
+        if epg_snapshot_lock.locked() or age < (EPG_SUBSET_INTERVAL if snap["key"] == key else EPG_SUBSET_MIN_AGE):
+            return snap
+    async with epg_snapshot_lock:
+        if epg_snapshot is snap:
+            body, matched = await asyncio.get_event_loop().run_in_executor(None, build_epg_subset)
+            etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+            if snap is not None and snap["etags"]["gzip"] == etag:
+                epg_snapshot = dict(snap, key=key, built=time.monotonic())
+            else:
+                mtime = int(time.time())
+                epg_snapshot = {"key": key, "built": time.monotonic(), "body": body, "etags": {"gzip": etag},
+                                "mtime": mtime, "last_modified": formatdate(mtime, usegmt=True)}
+                print(f"📺 EPG subset rebuilt: {matched:,} channels, {len(body):,} bytes gzipped")
+        return epg_snapshot
+
+async def serve_epg(request):
+    snap = await current_epg_snapshot()
+    headers = {
+        "ETag": snap["etags"]["gzip"],
+        "Last-Modified": snap["last_modified"],
+        "Cache-Control": f"public, max-age={EPG_MAX_AGE}",
+    }
+    if not_modified(request, snap, headers["ETag"]):
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=snap["body"], headers=headers, content_type="application/gzip")
+
+async def serve_playlist(request):
+    snap = await current_playlist_snapshot()
+    if not snap["bodies"]:
+        return web.Response(status=404)
+    encoding = pick_encoding(request.headers.get("Accept-Encoding", ""), snap["bodies"])
+    headers = {
+        "ETag": snap["etags"][encoding],
+        "Last-Modified": snap["last_modified"],
+        "Cache-Control": f"public, max-age={PLAYLIST_MAX_AGE}",
+        "Vary": "Accept-Encoding",
+        "Accept-Ranges": "bytes",
+    }
+    if not_modified(request, snap, headers["ETag"]):
+        return web.Response(status=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    body = snap["bodies"][encoding]
+    status = 200
+    rng = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if rng and (if_range is None or if_range.strip() in (headers["ETag"], headers["Last-Modified"])):
+        span = parse_range(rng, len(body))
+        if span is False:
+            headers["Content-Range"] = f"bytes */{len(body)}"
+            return web.Response(status=416, headers=headers)
+        if span:
+            start, end = span
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            body = memoryview(body)[start:end + 1]
+            status = 206
+    return web.Response(body=body, status=status, headers=headers, content_type="audio/x-mpegurl")
 
 async def start_server():
     app = web.Application()
     app.router.add_get('/playlist.m3u', serve_playlist)
-    runner = web.AppRunner(app)
+    app.router.add_get('/epg.xml.gz', serve_epg)
+    runner = web.AppRunner(app, access_log=None)
     await runner.setup()
     await web.TCPSite(runner, '0.0.0.0', 8080).start()
 
@@ -473,9 +1504,14 @@ async def main():
     print(" .git repos → cloned | raw URLs → downloaded ")
     print("✅" * 30)
 
+    install_dns_cache()
     asyncio.create_task(start_cloudflared_early())
+    asyncio.create_task(epg_loop())
+    proxy_pool.load()
+    asyncio.create_task(proxy_loop())
     await start_server()
     load_persistence()
+    await asyncio.get_event_loop().run_in_executor(None, playlist_writer.flush)
 
     count = await run_github_cycle()
 
@@ -504,8 +1540,6 @@ if __name__ == "__main__":
         asyncio.run(main())
     except KeyboardInterrupt:
         print("\n🛑 Shutting down...")
-        if os.path.exists(TEMP_DIR):
-            shutil.rmtree(TEMP_DIR, ignore_errors=True)
     except Exception as e:
         print(f"\n❌ Fatal: {e}")
         sys.exit(1)
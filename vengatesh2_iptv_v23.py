@@ -16,11 +16,21 @@ import logging
 import shutil
 import subprocess
 import re
+import socket
 import tempfile
+import threading
+import itertools
+import hashlib
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
 from pathlib import Path
-from urllib.parse import urlparse, quote_plus
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse, urljoin, quote_plus
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED, Future
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool, PoolManager
 from bs4 import BeautifulSoup
 
 # ------------- CONFIG -------------
@@ -34,6 +44,19 @@ WORKER_COUNT = 6
 UPDATE_INTERVAL_MINUTES = 3
 HEADERS = {"User-Agent": "Mozilla/5.0 (Linux; Android 10) AppleWebKit/537.36"}
 REQUEST_TIMEOUT = 10
+STREAM_CHUNK_SIZE = 64 * 1024
+VALIDATE_TIMEOUT = 8
+DNS_CACHE_TTL = 300
+DNS_NEGATIVE_TTL = 120
+DNS_CACHE_SIZE = 8192
+VALIDATE_SNIFF = True
+SNIFF_BYTES = 4096
+FMP4_BOXES = (b"ftyp", b"styp", b"moof", b"sidx", b"moov")
+POOL_CONNECTIONS = 64
+POOL_MAXSIZE = 16
+DISCOVERY_WORKERS = 16
+DISCOVERY_PER_ORIGIN = 4
+HOST_POOL_SIZES = {"raw.githubusercontent.com": 32, "cdn.jsdelivr.net": 32, "livebox.co.in": 24}
 
 # ---------------- YOUR FULL SOURCES (NO OMISSIONS) ----------------
 ALL_SOURCES = [
@@ -344,12 +367,219 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(me
 log = logging.getLogger("iptv-goliath")
 
 # ------------- GLOBAL STATE -------------
-WRITTEN_CHANNELS = set()
+class UrlHashSet:
+    """Membership-only URL set: 64-bit blake2b hashes in a sorted array('Q'), 8 bytes per URL.
+
+    The URL strings themselves stay on disk (playlist / DB). Recent additions sit in a small
+    set and are merged into the sorted array every MERGE_AT adds. A false positive needs a
+    64-bit hash collision (~n^2 / 2^65, i.e. about 3e-8 at a million URLs).
+    """
+    MERGE_AT = 1 << 15
+
+    def __init__(self, urls=()):
+        self._sorted = array("Q")
+        self._recent = set()
+        self._lock = threading.Lock()
+        self.update(urls)
+
+    @staticmethod
+    def hash(url):
+        return int.from_bytes(hashlib.blake2b(url.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little")
+
+    def _has(self, h):
+        if h in self._recent:
+            return True
+        i = bisect_left(self._sorted, h)
+        return i < len(self._sorted) and self._sorted[i] == h
+
+    def _merge(self, extra=()):
+        # Both inputs are sorted, so one linear merge; groupby drops duplicates.
+        merged = heapq.merge(self._sorted, sorted(self._recent), extra)
+        self._sorted = array("Q", (h for h, _ in itertools.groupby(merged)))
+        self._recent = set()
+
+    def __contains__(self, url):
+        h = self.hash(url)
+        with self._lock:
+            return self._has(h)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sorted) + len(self._recent)
+
+    def add(self, url):
+        """Returns True if url was not in the set yet."""
+        h = self.hash(url)
+        with self._lock:
+            if self._has(h):
+                return False
+            self._recent.add(h)
+            if len(self._recent) >= self.MERGE_AT:
+                self._merge()
+            return True
+
+    def update(self, urls):
+        """Bulk load: hash everything, sort once, merge once."""
+        hashes = sorted(map(self.hash, urls))
+        if hashes:
+            with self._lock:
+                self._merge(hashes)
+
+WRITTEN_CHANNELS = UrlHashSet()
+HTTP_POOL_STATS = {"requests": 0, "new_connections": 0}
+_pool_stats_lock = threading.Lock()
+_http_local = threading.local()
+
+# ------------- HTTP POOL -------------
+class _CountingHTTPPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count_pool_stat("new_connections")
+        return super()._new_conn()
+
+class _CountingHTTPSPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count_pool_stat("new_connections")
+        return super()._new_conn()
+
+class _HostTunedPoolManager(PoolManager):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_classes_by_scheme = {"http": _CountingHTTPPool, "https": _CountingHTTPSPool}
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        request_context = dict(request_context or self.connection_pool_kw)
+        request_context["maxsize"] = pool_size_for_host(host)
+        return super()._new_pool(scheme, host, port, request_context)
+
+class PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = _HostTunedPoolManager(num_pools=connections, maxsize=maxsize, block=block, **pool_kwargs)
+
+    def send(self, request, **kwargs):
+        _count_pool_stat("requests")
+        return super().send(request, **kwargs)
+
+def _count_pool_stat(key):
+    with _pool_stats_lock:
+        HTTP_POOL_STATS[key] += 1
+
+def pool_size_for_host(host):
+    host = (host or "").lower()
+    for suffix, size in HOST_POOL_SIZES.items():
+        if host == suffix or host.endswith("." + suffix):
+            return size
+    return POOL_MAXSIZE
+
+HTTP_ADAPTER = PooledAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+
+def http_session():
+    # Sessions are per thread; the adapter (and so every keep-alive pool) is shared.
+    s = getattr(_http_local, "session", None)
+    if s is None:
+        s = requests.Session()
+        s.headers.update(HEADERS)
+        s.mount("http://", HTTP_ADAPTER)
+        s.mount("https://", HTTP_ADAPTER)
+        _http_local.session = s
+    return s
+
+def http_pool_stats():
+    with _pool_stats_lock:
+        stats = dict(HTTP_POOL_STATS)
+    stats["reused"] = max(0, stats["requests"] - stats["new_connections"])
+    return stats
+
+def log_http_pool_stats():
+    s = http_pool_stats()
+    pct = 100.0 * s["reused"] / s["requests"] if s["requests"] else 0.0
+    log.info("🔌 HTTP pool: %d requests, %d new connections, %d reused (%.0f%%)", s["requests"], s["new_connections"], s["reused"], pct)
+    d = DNS_CACHE.stats
+    log.info("🌐 DNS cache: %d hits, %d lookups (%d failed)", d["hits"], d["lookups"], d["negative"])
+
+# ------------- DNS CACHE -------------
+class DnsCache:
+    """getaddrinfo with a shared cache: answers are kept DNS_CACHE_TTL, failures (NXDOMAIN and
+    friends) DNS_NEGATIVE_TTL, and concurrent lookups of one name wait on a single resolution.
+
+    getaddrinfo does not expose record TTLs, so the TTLs are fixed.
+    """
+    def __init__(self, ttl=DNS_CACHE_TTL, negative_ttl=DNS_NEGATIVE_TTL, size=DNS_CACHE_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.size = size
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "lookups": 0, "negative": 0}
+
+    @staticmethod
+    def _answer(value):
+        if isinstance(value, socket.gaierror):
+            raise socket.gaierror(*value.args)
+        return list(value)
+
+    def _cached(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry
+
+    def cached(self, host, port=0, family=0, type=0, proto=0, flags=0):
+        """The cached answer, without resolving; None on a miss, raises on a cached failure."""
+        with self._lock:
+            entry = self._cached((host, port, family, type, proto, flags))
+        return None if entry is None else self._answer(entry[1])
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        key = (host, port, family, type, proto, flags)
+        with self._lock:
+            entry = self._cached(key)
+            if entry is not None:
+                return self._answer(entry[1])
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                self._inflight[key] = future = Future()
+        if waiter is not None:
+            return self._answer(waiter.result())
+        try:
+            value, ttl = _system_getaddrinfo(host, port, family, type, proto, flags), self.ttl
+        except socket.gaierror as e:
+            value, ttl = e, self.negative_ttl
+        except BaseException as e:
+            # Anything else (interrupted, out of fds) is not an answer about the name: not cached.
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self.stats["lookups"] += 1
+            self.stats["negative"] += isinstance(value, socket.gaierror)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+            del self._inflight[key]
+        future.set_result(value)
+        return self._answer(value)
+
+_system_getaddrinfo = socket.getaddrinfo
+DNS_CACHE = DnsCache()
+
+def install_dns_cache():
+    # requests/urllib3 and urllib all resolve through socket.getaddrinfo at call time.
+    socket.getaddrinfo = DNS_CACHE.getaddrinfo
 
 # ------------- UTILITIES -------------
 def safe_get(url, timeout=REQUEST_TIMEOUT, allow_redirects=True, stream=False):
     try:
-        r = requests.get(url, headers=HEADERS, timeout=timeout, allow_redirects=allow_redirects, stream=stream)
+        r = http_session().get(url, timeout=timeout, allow_redirects=allow_redirects, stream=stream)
         r.raise_for_status()
         return r
     except Exception as e:
@@ -359,7 +589,7 @@ def safe_get(url, timeout=REQUEST_TIMEOUT, allow_redirects=True, stream=False):
 def expand_short_url(url):
     if any(x in url for x in ["bit.ly", "tinyurl.com", "goo.gl", "t.co"]):
         try:
-            r = requests.head(url, headers=HEADERS, timeout=8, allow_redirects=True)
+            r = http_session().head(url, timeout=8, allow_redirects=True)
             if r and r.status_code in (200, 301, 302, 303, 307, 308):
                 return r.url
         except Exception:
@@ -367,89 +597,255 @@ def expand_short_url(url):
     return url
 
 # ------------- PARSING -------------
-def extract_stream_urls_from_m3u(text, base_url=""):
-    urls = set()
-    lines = text.splitlines()
-    for line in lines:
-        line = line.strip()
-        if line.startswith("#"):
+# One match per entry: an optional #EXTINF line, any directive/blank lines, then the URL line.
+_M3U_ENTRY_RE = re.compile(rb'^(?:#EXTINF:([^\n]*)\n(?:[ \t\r]*(?:#(?!EXTINF)[^\n]*)?\n)*)?[ \t]*([^#\s][^\r\n]*)', re.M)
+_HREF_M3U_RE = re.compile(rb'href=[\'"]([^\'"]*\.(?:m3u|m3u8))[\'"]')
+_MAX_CARRY_BYTES = 1 << 20
+_URL_SCHEMES = ("http://", "https://", "rtmp://", "rtmps://", "rtsp://", "rtp://", "udp://", "mms://")
+
+class M3UEntry:
+    """One playlist entry: url plus #EXTINF fields, parsed on first access."""
+    __slots__ = ("url", "_info", "_meta")
+
+    def __init__(self, url, info=b""):
+        self.url = url
+        self._info = info
+        self._meta = None
+
+    def _fields(self):
+        if self._meta is None:
+            self._meta = _parse_extinf(self._info)
+        return self._meta
+
+    name = property(lambda self: self._fields()[0])
+    tvg_id = property(lambda self: self._fields()[1])
+    tvg_logo = property(lambda self: self._fields()[2])
+    group_title = property(lambda self: self._fields()[3])
+    duration = property(lambda self: self._fields()[4])
+
+def _parse_extinf(info):
+    parts = info.split(b'"')
+    tvg_id = tvg_logo = group = None
+    for i in range(1, len(parts) - 1, 2):
+        key = parts[i - 1]
+        if key.endswith(b"tvg-id="):
+            tvg_id = parts[i].decode("utf-8", "replace") or None
+        elif key.endswith(b"tvg-logo="):
+            tvg_logo = parts[i].decode("utf-8", "replace") or None
+        elif key.endswith(b"group-title="):
+            group = parts[i].decode("utf-8", "replace") or None
+    # The title follows the first comma after the last quoted attribute.
+    tail = parts[-1]
+    comma = tail.find(b",")
+    name = tail[comma + 1:].strip().decode("utf-8", "replace") or None if comma >= 0 else None
+    head = parts[0].split(b",", 1)[0].split(None, 1)
+    try:
+        duration = float(head[0]) if head else -1.0
+    except ValueError:
+        duration = -1.0
+    return name, tvg_id, tvg_logo, group, duration
+
+def iter_file_chunks(f, size=STREAM_CHUNK_SIZE):
+    return iter(lambda: f.read(size), b"")
+
+def _split_complete(buf):
+    """Split buf after its last URL line, so a trailing #EXTINF waits for its URL."""
+    end = buf.rfind(b"\n")
+    while end >= 0:
+        start = buf.rfind(b"\n", 0, end) + 1
+        line = buf[start:end].strip()
+        if line and line[0] != 35:  # not "#"
+            return buf[:end + 1], buf[end + 1:]
+        end = start - 1
+    return b"", buf
+
+def iter_m3u_entries(chunks, base_url="", scan_hrefs=False):
+    """Stream M3UEntry records out of an iterable of bytes chunks.
+
+    Entries are paired by one regex pass per chunk instead of a Python loop
+    per line, and only the unfinished tail is carried into the next chunk,
+    so memory stays flat for any playlist size. Relative URLs are resolved
+    against base_url; with scan_hrefs, href="...m3u" links in HTML pages
+    are yielded too.
+    """
+    carry = b""
+    for chunk in itertools.chain(chunks, (None,)):
+        if chunk is None:
+            region, carry = carry + b"\n", b""
+        elif not chunk:
             continue
-        if line.startswith("http"):
-            if ".m3u" in line or ".m3u8" in line:
-                continue  # skip nested playlists
+        else:
+            region, carry = _split_complete(carry + chunk)
+            if len(carry) > _MAX_CARRY_BYTES:
+                carry = b""
+        for info, raw in _M3U_ENTRY_RE.findall(region):
+            if scan_hrefs and b"href=" in raw:
+                for href in _HREF_M3U_RE.findall(raw):
+                    yield M3UEntry(urljoin(base_url, href.decode("utf-8", "replace")))
+                continue
+            url = raw.decode("utf-8", "replace").rstrip()
+            if "://" in url:
+                # Scheme first: skips HTML/markdown/JS lines that merely contain a link.
+                if not url.lower().startswith(_URL_SCHEMES):
+                    continue
+            elif not base_url or " " in url or "<" in url:
+                continue
             else:
-                urls.add(line)
-        elif line and not line.startswith("#"):
-            from urllib.parse import urljoin
-            full = urljoin(base_url, line)
-            if not (".m3u" in full or ".m3u8" in full):
-                urls.add(full)
-    return urls
-
-def extract_m3u_urls_from_text(text):
-    urls = set()
-    for line in text.splitlines():
-        line = line.strip()
-        if line.startswith("http") and (".m3u" in line or ".m3u8" in line):
-            urls.add(line)
-        elif "href=" in line:
-            m = re.search(r'href=[\'"]([^\'"]*\.(?:m3u|m3u8))[\'"]', line)
-            if m:
-                urls.add(m.group(1))
-    return urls
+                url = urljoin(base_url, url)
+            yield M3UEntry(url, info)
+
+def extract_stream_urls_from_m3u(chunks, base_url=""):
+    # nested playlists are skipped; only media entries count as streams
+    return {e.url for e in iter_m3u_entries(chunks, base_url) if ".m3u" not in e.url}
+
+def extract_m3u_urls_from_text(chunks, base_url=""):
+    return {e.url for e in iter_m3u_entries(chunks, base_url, scan_hrefs=True) if ".m3u" in e.url}
 
 # ------------- DISCOVERY -------------
+class OriginScheduler:
+    """Hands tasks to `executor` with at most `per_origin` running per origin at a time.
+
+    The rest wait in a per-origin queue rather than in a worker thread, so a slow origin
+    with hundreds of URLs never ties up the pool while other hosts have work ready.
+    submit() returns a Future that settles with the task's own result.
+    """
+    def __init__(self, executor, per_origin=DISCOVERY_PER_ORIGIN):
+        self.executor = executor
+        self.per_origin = per_origin
+        self._lock = threading.Lock()
+        self._running = {}
+        self._waiting = {}
+
+    def submit(self, url, fn, *args):
+        future = Future()
+        origin = urlparse(url).netloc.lower()
+        with self._lock:
+            start = self._running.get(origin, 0) < self.per_origin
+            if start:
+                self._running[origin] = self._running.get(origin, 0) + 1
+            else:
+                self._waiting.setdefault(origin, deque()).append((future, fn, args))
+        if start:
+            self._start(origin, future, fn, args)
+        return future
+
+    def _start(self, origin, future, fn, args):
+        self.executor.submit(fn, *args).add_done_callback(lambda inner: self._finish(origin, future, inner))
+
+    def _finish(self, origin, future, inner):
+        with self._lock:
+            waiting = self._waiting.get(origin)
+            following = waiting.popleft() if waiting else None
+            if following is None:
+                self._running[origin] -= 1
+        if following is not None:
+            self._start(origin, *following)
+        if inner.exception() is not None:
+            future.set_exception(inner.exception())
+        else:
+            future.set_result(inner.result())
+
+def _discover_task(kind, url):
+    """Returns (streams, followups); followups are further ("m3u", url) tasks."""
+    if kind == "git":
+        repo = url.replace(".git", "").replace("https://github.com/", "")
+        bases = [
+            f"https://raw.githubusercontent.com/{repo}/main/",
+            f"https://raw.githubusercontent.com/{repo}/master/",
+            f"https://cdn.jsdelivr.net/gh/{repo}/"
+        ]
+        files = ["playlist.m3u", "index.m3u", "live.m3u", "streams.m3u", "playlist.m3u8"]
+        return set(), [("m3u", base + file) for base in bases for file in files]
+    r = safe_get(url, stream=True)
+    if not r:
+        return set(), []
+    with r:
+        chunks = r.iter_content(STREAM_CHUNK_SIZE)
+        if kind == "m3u":
+            return extract_stream_urls_from_m3u(chunks, url), []
+        return set(), [("m3u", pl) for pl in extract_m3u_urls_from_text(chunks, url)]
+
 def discover_from_all_sources():
     found_streams = set()
-    for src in ALL_SOURCES:
-        try:
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=DISCOVERY_WORKERS) as ex:
+        scheduler = OriginScheduler(ex)
+        pending = {}
+        for src in ALL_SOURCES:
             if src.endswith(".git"):
-                repo = src.replace(".git", "").replace("https://github.com/", "")
-                bases = [
-                    f"https://raw.githubusercontent.com/{repo}/main/",
-                    f"https://raw.githubusercontent.com/{repo}/master/",
-                    f"https://cdn.jsdelivr.net/gh/{repo}/"
-                ]
-                files = ["playlist.m3u", "index.m3u", "live.m3u", "streams.m3u", "playlist.m3u8"]
-                for base in bases:
-                    for file in files:
-                        url = base + file
-                        r = safe_get(url)
-                        if r and r.text:
-                            streams = extract_stream_urls_from_m3u(r.text, base)
-                            found_streams.update(streams)
+                kind = "git"
             elif ".m3u" in src or ".m3u8" in src:
-                r = safe_get(src)
-                if r and r.text:
-                    streams = extract_stream_urls_from_m3u(r.text, src)
-                    found_streams.update(streams)
+                kind = "m3u"
             else:
-                r = safe_get(src)
-                if r and r.text:
-                    playlist_urls = extract_m3u_urls_from_text(r.text)
-                    for pl in playlist_urls:
-                        r2 = safe_get(pl)
-                        if r2 and r2.text:
-                            streams = extract_stream_urls_from_m3u(r2.text, pl)
-                            found_streams.update(streams)
-        except Exception as e:
-            log.debug("discover_from_all_sources failed for %s: %s", src, e)
+                kind = "page"
+            pending[scheduler.submit(src, _discover_task, kind, src)] = src
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                src = pending.pop(fut)
+                try:
+                    streams, followups = fut.result()
+                except Exception as e:
+                    log.debug("discover_from_all_sources failed for %s: %s", src, e)
+                    continue
+                found_streams.update(streams)
+                for kind, url in followups:
+                    pending[scheduler.submit(url, _discover_task, kind, url)] = url
+    log.info("Discovery fan-out finished in %.1fs", time.time() - started)
     return found_streams
 
 # ------------- VALIDATORS -------------
+def sniff_media(data):
+    """Name the container `data` starts with (mpegts, hls, id3, adts, fmp4), or None."""
+    head = data.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if head.startswith(b"#EXTM3U"):
+        return "hls"
+    if data[:3] == b"ID3":
+        return "id3"
+    if data[4:8] in FMP4_BOXES:
+        return "fmp4"
+    if len(data) >= 2 and data[0] == 0xFF and data[1] & 0xF6 == 0xF0:
+        return "adts"
+    # TS: the 0x47 sync byte repeating at a 188-byte stride, from any offset within the first packet.
+    i = data.find(b"\x47", 0, 188)
+    while i != -1 and i + 376 < len(data):
+        if data[i + 188] == 0x47 and data[i + 376] == 0x47:
+            return "mpegts"
+        i = data.find(b"\x47", i + 1, 188)
+    return None
+
+def probe_media(url, timeout=VALIDATE_TIMEOUT):
+    """Range-GET at most SNIFF_BYTES of `url` and sniff them; the response is always closed."""
+    data = b""
+    with http_session().get(url, headers={"Range": f"bytes=0-{SNIFF_BYTES - 1}"}, timeout=timeout, stream=True) as r:
+        if r.status_code not in (200, 206):
+            return None, r.status_code
+        for chunk in r.iter_content(1024):
+            data += chunk
+            kind = sniff_media(data)
+            if kind or len(data) >= SNIFF_BYTES:
+                return kind, r.status_code
+    return sniff_media(data), r.status_code
+
 def validate_url_pipeline(url):
+    # VALIDATE_SNIFF checks the first bytes instead of trusting Content-Type (text/plain TS is common).
     final = expand_short_url(url)
     try:
-        r = requests.head(final, headers=HEADERS, timeout=8, allow_redirects=True)
-        if r and 200 <= r.status_code < 400:
-            ct = (r.headers.get("Content-Type") or "").lower()
-            if any(k in ct for k in ("mpeg", "video", "audio", "apple.mpegurl", "x-mpegurl", "octet-stream")):
-                return True, f"head-{r.status_code}", final
-        r2 = requests.get(final, headers=HEADERS, timeout=8, stream=True)
-        if r2 and r2.status_code == 200:
-            ct = (r2.headers.get("Content-Type") or "").lower()
-            if any(k in ct for k in ("mpeg", "video", "audio", "apple.mpegurl", "x-mpegurl")):
-                return True, "get-ok", final
+        if VALIDATE_SNIFF:
+            kind, status = probe_media(final)
+            if kind:
+                return True, f"sniff-{kind}", final
+            return False, "fail", final
+        with http_session().head(final, timeout=VALIDATE_TIMEOUT, allow_redirects=True) as r:
+            if 200 <= r.status_code < 400:
+                ct = (r.headers.get("Content-Type") or "").lower()
+                if any(k in ct for k in ("mpeg", "video", "audio", "apple.mpegurl", "x-mpegurl", "octet-stream")):
+                    return True, f"head-{r.status_code}", final
+        with http_session().get(final, timeout=VALIDATE_TIMEOUT, stream=True) as r2:
+            if r2.status_code == 200:
+                ct = (r2.headers.get("Content-Type") or "").lower()
+                if any(k in ct for k in ("mpeg", "video", "audio", "apple.mpegurl", "x-mpegurl")):
+                    return True, "get-ok", final
     except Exception:
         pass
     return False, "fail", final
@@ -477,7 +873,8 @@ def ensure_playlist_header(path=LOCAL_PLAYLIST):
 
 def append_to_playlist(url, title=None, logo=None, path=LOCAL_PLAYLIST):
     global WRITTEN_CHANNELS
-    if url in WRITTEN_CHANNELS:
+    # add() claims the URL atomically, so two workers finding the same stream cannot both append it.
+    if not WRITTEN_CHANNELS.add(url):
         return False
     with open(path, "a", encoding="utf-8") as f:
         if title or logo:
@@ -491,10 +888,15 @@ def append_to_playlist(url, title=None, logo=None, path=LOCAL_PLAYLIST):
                 f.write(f'#EXTINF:-1,{title or url}\n{url}\n')
         else:
             f.write(f'{url}\n')
-    WRITTEN_CHANNELS.add(url)
     log.info("✅ ADDED to playlist: %s", title or url[:50])
     return True
 
+def load_existing_playlist_channels(path=LOCAL_PLAYLIST):
+    if path.exists():
+        with open(path, "rb") as f:
+            WRITTEN_CHANNELS.update(e.url for e in iter_m3u_entries(iter_file_chunks(f)))
+    log.info("Initialized WRITTEN_CHANNELS with %d existing URLs", len(WRITTEN_CHANNELS))
+
 # ------------- VALIDATION W/ REPLACEMENT -------------
 def validate_and_maybe_replace(conn, url, title):
     global WRITTEN_CHANNELS
@@ -535,8 +937,11 @@ def git_push_local():
 # ------------- MAIN LOOP -------------
 def main():
     log.info("🚀 Starting VENGATESH IPTV GOLIATH (Termux Mode)")
+    install_dns_cache()
     ensure_playlist_header()
+    load_existing_playlist_channels()
     perform_discovery_and_validation()
+    log_http_pool_stats()
     if LOCAL_PLAYLIST.exists():
         git_push_local()
     log.info("📊 Total channels in playlist: %d", len(WRITTEN_CHANNELS))
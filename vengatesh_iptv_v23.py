@@ -1,10 +1,19 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import os, sys, time, json, sqlite3, logging, shutil, subprocess, re, tempfile
+import os, sys, time, json, sqlite3, logging, shutil, subprocess, re, tempfile, random, socket
+import threading, queue
+import asyncio, hashlib, itertools, gzip, calendar, heapq, math, struct
+import xml.etree.ElementTree as ET
+from array import array
+from bisect import bisect_left
 from pathlib import Path
-from urllib.parse import urlparse, quote_plus
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict, deque
+from urllib.parse import urlparse, urljoin, quote_plus, urlsplit, urlunsplit, parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor, as_completed, Future
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool, PoolManager
+import aiohttp
 from bs4 import BeautifulSoup
 
 LOCAL_PLAYLIST = Path("playlist.m3u")
@@ -16,6 +25,81 @@ WORKER_COUNT = 8
 UPDATE_INTERVAL_MINUTES = 3
 HEADERS = {"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36"}
 REQUEST_TIMEOUT = 12
+POOL_CONNECTIONS = 64
+POOL_MAXSIZE = 16
+HOST_POOL_SIZES = {"raw.githubusercontent.com": 32, "cdn.jsdelivr.net": 32, "livebox.co.in": 24}
+VALIDATE_TIMEOUT = 8
+DNS_CACHE_TTL = 300
+DNS_NEGATIVE_TTL = 120
+DNS_CACHE_SIZE = 8192
+HOST_FAIL_THRESHOLD = 3
+HOST_OPEN_SECONDS = 300
+HOST_OPEN_MAX = 3600
+ASYNC_MAX_CONCURRENCY = 400
+ASYNC_PER_HOST_LIMIT = 6
+SHORTENER_HOSTS = ["bit.ly", "tinyurl.com", "goo.gl", "t.co"]
+HEAD_MEDIA_TYPES = ("mpeg", "video", "audio", "apple.mpegurl", "x-mpegurl", "octet-stream")
+GET_MEDIA_TYPES = ("mpeg", "video", "audio", "apple.mpegurl", "x-mpegurl")
+VALIDATE_SNIFF = True
+SNIFF_BYTES = 4096
+FMP4_BOXES = (b"ftyp", b"styp", b"moof", b"sidx", b"moov")
+DEEP_PROBE = False
+DEEP_PROBE_TIMEOUT = 10
+DEEP_PROBE_PLAYLIST_BYTES = 256 * 1024
+DEEP_PROBE_SEGMENT_BYTES = 512 * 1024
+SOURCE_CACHE_MAX_AGE = 6 * 3600
+STREAM_CHUNK_SIZE = 64 * 1024
+SOURCE_SPOOL_BYTES = 1 << 20
+DISCOVERY_WORKERS = 32
+DISCOVERY_PER_ORIGIN = 4
+REPO_BASES = ["https://raw.githubusercontent.com/{repo}/main/", "https://raw.githubusercontent.com/{repo}/master/", "https://cdn.jsdelivr.net/gh/{repo}/"]
+REPO_FILES = ["playlist.m3u", "index.m3u", "movies.m3u", "series.m3u", "playlist.m3u8", "index.m3u8"]
+REPO_MISS_TTL = 24 * 3600
+TITLE_INDEX_MAX_URLS = 20
+MIRRORS_PER_CHANNEL = 0
+DEAD_FILTER_FILE = Path("dead_urls.bloom")
+DEAD_FILTER_CAPACITY = 500000
+DEAD_FILTER_FP_RATE = 0.001
+DEAD_AFTER_FAILS = 10
+DEAD_AMNESTY = 14 * 24 * 3600
+TRACKING_PARAMS = {"utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content", "fbclid", "gclid", "dclid", "msclkid", "igshid", "mc_cid", "mc_eid", "_"}
+DEFAULT_PORTS = {"http": 80, "https": 443, "rtmp": 1935}
+VALIDATION_BUDGET = 10000
+RETRY_BASE_INTERVAL = UPDATE_INTERVAL_MINUTES * 60
+RETRY_MAX_INTERVAL = 7 * 24 * 3600
+FLAKY_RETRY_MAX_INTERVAL = 2 * 3600
+RECHECK_OK_INTERVAL = 12 * 3600
+RECHECK_FLAKY_INTERVAL = 30 * 60
+FLAKY_OK_RATIO = 0.9
+SCHEDULE_JITTER = 0.1
+DB_COMMIT_INTERVAL = 0.25
+DB_BATCH_MAX = 5000
+META_CACHE_TTL = 30 * 24 * 3600
+META_LRU_SIZE = 4096
+META_ERROR_RETRY = 15 * 60
+META_FETCH_WORKERS = 8
+META_FETCH_RATE = 4.0
+EPG_WORKERS = 6
+EPG_BATCH = 2000
+EPG_RETENTION = 6 * 3600
+EPG_HORIZON = 3 * 24 * 3600
+STATUS_NEW, STATUS_OK, STATUS_FAIL = 0, 1, 2
+SQL_DUE_CHANNELS = "SELECT url, title FROM channels WHERE next_check <= ? ORDER BY next_check LIMIT ?"
+# status is inlined, not bound, so the planner can match the partial idx_channels_ok whatever the stats say.
+SQL_OK_CHANNELS = f"SELECT url, title FROM channels WHERE status = {STATUS_OK} LIMIT ?"
+SQL_RANKED_CHANNELS = f"SELECT url, title, title_guessed, logo, tvg_id, latency_ms, kbps, checks, oks FROM channels WHERE status = {STATUS_OK}"
+SQL_TITLE_INDEX = "SELECT url, title FROM channels WHERE title IS NOT NULL AND status != ?"
+SQL_CHECK_STATE = "SELECT url, fail_streak, checks, oks FROM channels WHERE url IN ({})"
+SQL_FINGERPRINTS = "SELECT fingerprint, url FROM channels WHERE fingerprint IN ({})"
+HOT_QUERIES = {
+    "due channels": (SQL_DUE_CHANNELS, (0, VALIDATION_BUDGET)),
+    "ok channels": (SQL_OK_CHANNELS, (VALIDATION_BUDGET,)),
+    "ranked channels": (SQL_RANKED_CHANNELS, ()),
+    "title index": (SQL_TITLE_INDEX, (STATUS_FAIL,)),
+    "check state": (SQL_CHECK_STATE.format("?"), ("",)),
+    "fingerprints": (SQL_FINGERPRINTS.format("?"), ("",)),
+    "meta cache": ("SELECT title, json, last_fetched FROM meta_cache WHERE title IN (?)", ("",)),
+}
 
 ALL_SOURCES = [
     "https://github.com/iptv-org/iptv.git",
@@ -321,11 +405,327 @@ AI_QUERIES = [
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 log = logging.getLogger("iptv-goliath")
-WRITTEN_CHANNELS = set()
+
+class UrlHashSet:
+    """Membership-only URL set: 64-bit blake2b hashes in a sorted array('Q'), 8 bytes per URL.
+
+    The URL strings themselves stay on disk (playlist / DB). Recent additions sit in a small
+    set and are merged into the sorted array every MERGE_AT adds. A false positive needs a
+    64-bit hash collision (~n^2 / 2^65, i.e. about 3e-8 at a million URLs).
+    """
+    MERGE_AT = 1 << 15
+
+    def __init__(self, urls=()):
+        self._sorted = array("Q")
+        self._recent = set()
+        self._lock = threading.Lock()
+        self.update(urls)
+
+    @staticmethod
+    def hash(url):
+        return int.from_bytes(hashlib.blake2b(url.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little")
+
+    def _has(self, h):
+        if h in self._recent:
+            return True
+        i = bisect_left(self._sorted, h)
+        return i < len(self._sorted) and self._sorted[i] == h
+
+    def _merge(self, extra=()):
+        # Both inputs are sorted, so one linear merge; groupby drops duplicates.
+        merged = heapq.merge(self._sorted, sorted(self._recent), extra)
+        self._sorted = array("Q", (h for h, _ in itertools.groupby(merged)))
+        self._recent = set()
+
+    def __contains__(self, url):
+        h = self.hash(url)
+        with self._lock:
+            return self._has(h)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sorted) + len(self._recent)
+
+    def add(self, url):
+        """Returns True if url was not in the set yet."""
+        h = self.hash(url)
+        with self._lock:
+            if self._has(h):
+                return False
+            self._recent.add(h)
+            if len(self._recent) >= self.MERGE_AT:
+                self._merge()
+            return True
+
+    def update(self, urls):
+        """Bulk load: hash everything, sort once, merge once."""
+        hashes = sorted(map(self.hash, urls))
+        if hashes:
+            with self._lock:
+                self._merge(hashes)
+
+WRITTEN_CHANNELS = UrlHashSet()
+
+class DeadUrlFilter:
+    """Rotating Bloom filter of URLs that have failed DEAD_AFTER_FAILS checks in a row.
+
+    Two generations: adds go to the current one, lookups check both, and every
+    amnesty/2 the older generation is dropped, so a dead URL is skipped for between
+    amnesty/2 and amnesty and then gets one more real check. A generation that
+    reaches `capacity` rotates early to hold the false-positive rate.
+    """
+    MAGIC = b"IPTVBLM1"
+    HEADER = struct.Struct("<8sQQII")  # magic, rotated_at, bits, hashes, current-generation count
+
+    def __init__(self, path, capacity=DEAD_FILTER_CAPACITY, fp_rate=DEAD_FILTER_FP_RATE, amnesty=DEAD_AMNESTY):
+        self.path = path
+        self.capacity = capacity
+        self.amnesty = amnesty
+        self.bits = max(64, int(-capacity * math.log(fp_rate) / math.log(2) ** 2) // 8 * 8)
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self._lock = threading.Lock()
+        self._reset(int(time.time()))
+
+    def _reset(self, now):
+        self.current = bytearray(self.bits // 8)
+        self.previous = bytearray(self.bits // 8)
+        self.count = 0
+        self.rotated_at = now
+
+    def _positions(self, url):
+        digest = hashlib.blake2b(url.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, url):
+        positions = self._positions(url)
+        with self._lock:
+            return any(all(gen[p >> 3] & (1 << (p & 7)) for p in positions) for gen in (self.current, self.previous))
+
+    def add(self, url):
+        positions = self._positions(url)
+        with self._lock:
+            for p in positions:
+                self.current[p >> 3] |= 1 << (p & 7)
+            self.count += 1
+            if self.count >= self.capacity:
+                self._rotate(int(time.time()))
+
+    def _rotate(self, now):
+        self.previous, self.current = self.current, bytearray(self.bits // 8)
+        self.count = 0
+        self.rotated_at = now
+
+    def maybe_rotate(self, now=None):
+        now = now or int(time.time())
+        with self._lock:
+            if now - self.rotated_at >= self.amnesty // 2:
+                self._rotate(now)
+                log.info("🪦 Dead-URL filter rotated: entries older than %dd get another check", self.amnesty // 86400)
+
+    def load(self):
+        # A missing, corrupt or differently-sized file (capacity/fp rate changed) starts empty.
+        try:
+            with open(self.path, "rb") as f:
+                magic, rotated_at, bits, hashes, count = self.HEADER.unpack(f.read(self.HEADER.size))
+                if (magic, bits, hashes) != (self.MAGIC, self.bits, self.hashes):
+                    return
+                current, previous = bytearray(f.read(bits // 8)), bytearray(f.read(bits // 8))
+        except (OSError, struct.error) as e:
+            log.debug("Dead-URL filter not loaded: %s", e)
+            return
+        if len(previous) == bits // 8:
+            with self._lock:
+                self.current, self.previous, self.count, self.rotated_at = current, previous, count, rotated_at
+
+    def save(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with self._lock:
+            header = self.HEADER.pack(self.MAGIC, self.rotated_at, self.bits, self.hashes, self.count)
+            current, previous = bytes(self.current), bytes(self.previous)
+        try:
+            with open(tmp, "wb") as f:
+                f.write(header)
+                f.write(current)
+                f.write(previous)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning("Could not save dead-URL filter: %s", e)
+
+DEAD_URLS = DeadUrlFilter(DEAD_FILTER_FILE)
+HTTP_POOL_STATS = {"requests": 0, "new_connections": 0}
+_pool_stats_lock = threading.Lock()
+_http_local = threading.local()
+_db_local = threading.local()
+DB_WRITER = None
+_meta_lru = OrderedDict()
+_meta_inflight = {}
+_meta_errors = {}
+_meta_lock = threading.Lock()
+_meta_rate_lock = threading.Lock()
+_meta_next_at = 0.0
+_enrich_thread = None
+
+class _CountingHTTPPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count_pool_stat("new_connections")
+        return super()._new_conn()
+
+class _CountingHTTPSPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count_pool_stat("new_connections")
+        return super()._new_conn()
+
+class _HostTunedPoolManager(PoolManager):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_classes_by_scheme = {"http": _CountingHTTPPool, "https": _CountingHTTPSPool}
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        request_context = dict(request_context or self.connection_pool_kw)
+        request_context["maxsize"] = pool_size_for_host(host)
+        return super()._new_pool(scheme, host, port, request_context)
+
+class PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = _HostTunedPoolManager(num_pools=connections, maxsize=maxsize, block=block, **pool_kwargs)
+
+    def send(self, request, **kwargs):
+        _count_pool_stat("requests")
+        return super().send(request, **kwargs)
+
+def _count_pool_stat(key):
+    with _pool_stats_lock:
+        HTTP_POOL_STATS[key] += 1
+
+def pool_size_for_host(host):
+    host = (host or "").lower()
+    for suffix, size in HOST_POOL_SIZES.items():
+        if host == suffix or host.endswith("." + suffix):
+            return size
+    return POOL_MAXSIZE
+
+HTTP_ADAPTER = PooledAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+
+def http_session():
+    # Sessions are per thread; the adapter (and so every keep-alive pool) is shared.
+    s = getattr(_http_local, "session", None)
+    if s is None:
+        s = requests.Session()
+        s.headers.update(HEADERS)
+        s.mount("http://", HTTP_ADAPTER)
+        s.mount("https://", HTTP_ADAPTER)
+        _http_local.session = s
+    return s
+
+def http_pool_stats():
+    with _pool_stats_lock:
+        stats = dict(HTTP_POOL_STATS)
+    stats["reused"] = max(0, stats["requests"] - stats["new_connections"])
+    return stats
+
+def log_http_pool_stats():
+    s = http_pool_stats()
+    pct = 100.0 * s["reused"] / s["requests"] if s["requests"] else 0.0
+    log.info("🔌 HTTP pool: %d requests, %d new connections, %d reused (%.0f%%)", s["requests"], s["new_connections"], s["reused"], pct)
+    d = DNS_CACHE.stats
+    log.info("🌐 DNS cache: %d hits, %d lookups (%d failed)", d["hits"], d["lookups"], d["negative"])
+
+class DnsCache:
+    """getaddrinfo with a shared cache: answers are kept DNS_CACHE_TTL, failures (NXDOMAIN and
+    friends) DNS_NEGATIVE_TTL, and concurrent lookups of one name wait on a single resolution.
+
+    getaddrinfo does not expose record TTLs, so the TTLs are fixed.
+    """
+    def __init__(self, ttl=DNS_CACHE_TTL, negative_ttl=DNS_NEGATIVE_TTL, size=DNS_CACHE_SIZE):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.size = size
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "lookups": 0, "negative": 0}
+
+    @staticmethod
+    def _answer(value):
+        if isinstance(value, socket.gaierror):
+            raise socket.gaierror(*value.args)
+        return list(value)
+
+    def _cached(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry
+
+    def cached(self, host, port=0, family=0, type=0, proto=0, flags=0):
+        """The cached answer, without resolving; None on a miss, raises on a cached failure."""
+        with self._lock:
+            entry = self._cached((host, port, family, type, proto, flags))
+        return None if entry is None else self._answer(entry[1])
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        key = (host, port, family, type, proto, flags)
+        with self._lock:
+            entry = self._cached(key)
+            if entry is not None:
+                return self._answer(entry[1])
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                self._inflight[key] = future = Future()
+        if waiter is not None:
+            return self._answer(waiter.result())
+        try:
+            value, ttl = _system_getaddrinfo(host, port, family, type, proto, flags), self.ttl
+        except socket.gaierror as e:
+            value, ttl = e, self.negative_ttl
+        except BaseException as e:
+            # Anything else (interrupted, out of fds) is not an answer about the name: not cached.
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self.stats["lookups"] += 1
+            self.stats["negative"] += isinstance(value, socket.gaierror)
+            self._entries[key] = (time.monotonic() + ttl, value)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+            del self._inflight[key]
+        future.set_result(value)
+        return self._answer(value)
+
+_system_getaddrinfo = socket.getaddrinfo
+DNS_CACHE = DnsCache()
+
+def install_dns_cache():
+    # requests/urllib3 and urllib all resolve through socket.getaddrinfo at call time.
+    socket.getaddrinfo = DNS_CACHE.getaddrinfo
+
+class CachedResolver(aiohttp.abc.AbstractResolver):
+    """aiohttp resolver on DNS_CACHE: hits are answered inline, misses resolve once in the default executor."""
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        infos = DNS_CACHE.cached(host, port, family, socket.SOCK_STREAM)
+        if infos is None:
+            infos = await asyncio.get_running_loop().run_in_executor(None, DNS_CACHE.getaddrinfo, host, port, family, socket.SOCK_STREAM)
+        return [{"hostname": host, "host": address[0], "port": address[1], "family": af, "proto": proto,
+                 "flags": socket.AI_NUMERICHOST | socket.AI_NUMERICSERV}
+                for af, _, proto, _, address in infos if af in (socket.AF_INET, socket.AF_INET6)]
+
+    async def close(self):
+        pass
 
 def safe_get(url, timeout=REQUEST_TIMEOUT, allow_redirects=True, stream=False):
     try:
-        r = requests.get(url, headers=HEADERS, timeout=timeout, allow_redirects=allow_redirects, stream=stream)
+        r = http_session().get(url, timeout=timeout, allow_redirects=allow_redirects, stream=stream)
         r.raise_for_status()
         return r
     except Exception as e:
@@ -333,18 +733,17 @@ def safe_get(url, timeout=REQUEST_TIMEOUT, allow_redirects=True, stream=False):
         return None
 
 def expand_short_url(url):
-    if any(x in url for x in ["bit.ly", "tinyurl.com", "goo.gl", "t.co"]):
+    if any(x in url for x in SHORTENER_HOSTS):
         try:
-            r = requests.head(url, headers=HEADERS, timeout=8, allow_redirects=True)
+            r = http_session().head(url, timeout=VALIDATE_TIMEOUT, allow_redirects=True)
             if r and r.status_code in (200, 301, 302, 303, 307, 308):
                 return r.url
         except Exception:
             pass
     return url
 
-def init_db():
-    conn = sqlite3.connect(DB_FILE, timeout=30)
-    conn.execute("PRAGMA journal_mode=WAL;")
+def _migrate_base(conn):
+    # Schema as it stood before versioning; every statement is idempotent so pre-versioned dbs pass through.
     conn.execute("""
         CREATE TABLE IF NOT EXISTS channels (
             id INTEGER PRIMARY KEY,
@@ -353,9 +752,18 @@ def init_db():
             logo TEXT,
             status TEXT,
             last_checked INTEGER,
-            info TEXT
+            info TEXT,
+            next_check INTEGER,
+            fail_streak INTEGER DEFAULT 0,
+            checks INTEGER DEFAULT 0,
+            oks INTEGER DEFAULT 0
         );
     """)
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(channels)")}
+    for column, decl in (("next_check", "INTEGER"), ("fail_streak", "INTEGER DEFAULT 0"), ("checks", "INTEGER DEFAULT 0"), ("oks", "INTEGER DEFAULT 0")):
+        if column not in existing:
+            conn.execute(f"ALTER TABLE channels ADD COLUMN {column} {decl}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_channels_next_check ON channels(next_check)")
     conn.execute("""
         CREATE TABLE IF NOT EXISTS meta_cache (
             id INTEGER PRIMARY KEY,
@@ -364,33 +772,442 @@ def init_db():
             last_fetched INTEGER
         );
     """)
-    conn.commit()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS source_cache (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            body_hash TEXT,
+            last_fetched INTEGER,
+            last_parsed INTEGER
+        );
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS repo_paths (
+            repo TEXT,
+            url TEXT,
+            ok INTEGER,
+            checked_at INTEGER,
+            PRIMARY KEY (repo, url)
+        );
+    """)
+
+def _migrate_status_codes(conn):
+    # Rebuild channels with an integer status and a non-null next_check (0 = due now).
+    conn.execute("""
+        CREATE TABLE channels_new (
+            id INTEGER PRIMARY KEY,
+            url TEXT UNIQUE,
+            title TEXT,
+            logo TEXT,
+            status INTEGER NOT NULL DEFAULT 0,
+            last_checked INTEGER,
+            info TEXT,
+            next_check INTEGER NOT NULL DEFAULT 0,
+            fail_streak INTEGER NOT NULL DEFAULT 0,
+            checks INTEGER NOT NULL DEFAULT 0,
+            oks INTEGER NOT NULL DEFAULT 0
+        );
+    """)
+    conn.execute("""
+        INSERT INTO channels_new
+        SELECT id, url, title, logo, CASE status WHEN 'ok' THEN ? WHEN 'fail' THEN ? ELSE ? END,
+               last_checked, info, COALESCE(next_check, 0), COALESCE(fail_streak, 0), COALESCE(checks, 0), COALESCE(oks, 0)
+        FROM channels
+    """, (STATUS_OK, STATUS_FAIL, STATUS_NEW))
+    conn.execute("DROP TABLE channels")
+    conn.execute("ALTER TABLE channels_new RENAME TO channels")
+
+def _migrate_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_channels_next_check ON channels(next_check)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_channels_status ON channels(status, last_checked)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_channels_title ON channels(title, status, url) WHERE title IS NOT NULL")
+    conn.execute("ANALYZE")
+
+def _migrate_epg(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS epg_channels (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            icon TEXT,
+            source TEXT
+        );
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS programmes (
+            channel TEXT NOT NULL,
+            start INTEGER NOT NULL,
+            stop INTEGER NOT NULL,
+            title TEXT,
+            descr TEXT,
+            source TEXT,
+            PRIMARY KEY (channel, start)
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_programmes_stop ON programmes(stop)")
+
+def _migrate_fingerprints(conn):
+    conn.execute("ALTER TABLE channels ADD COLUMN fingerprint TEXT")
+    conn.create_function("url_fingerprint", 1, url_fingerprint, deterministic=True)
+    conn.execute("UPDATE channels SET fingerprint = url_fingerprint(url)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_channels_fingerprint ON channels(fingerprint)")
+
+def _migrate_mirror_metrics(conn):
+    conn.execute("ALTER TABLE channels ADD COLUMN tvg_id TEXT")
+    conn.execute("ALTER TABLE channels ADD COLUMN latency_ms INTEGER")
+    conn.execute("ALTER TABLE channels ADD COLUMN kbps INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_channels_tvg_id ON channels(tvg_id) WHERE tvg_id IS NOT NULL")
+
+def _migrate_title_guessed(conn):
+    # Titles made up from the URL path ("Index", "Playlist") are flagged so they never identify a channel.
+    conn.execute("ALTER TABLE channels ADD COLUMN title_guessed INTEGER NOT NULL DEFAULT 0")
+    conn.create_function("guess_title_from_url", 1, guess_title_from_url, deterministic=True)
+    conn.execute("UPDATE channels SET title_guessed = 1 WHERE title IS NOT NULL AND title = guess_title_from_url(url)")
+
+def _migrate_ok_index(conn):
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_channels_ok ON channels(status) WHERE status = {STATUS_OK}")
+
+SCHEMA_MIGRATIONS = [_migrate_base, _migrate_status_codes, _migrate_indexes, _migrate_epg, _migrate_mirror_metrics, _migrate_fingerprints,
+                     _migrate_title_guessed, _migrate_ok_index]
+
+def init_db():
+    conn = sqlite3.connect(DB_FILE, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migrate in enumerate(SCHEMA_MIGRATIONS[version:], version + 1):
+        conn.execute("BEGIN")
+        with conn:
+            migrate(conn)
+            conn.execute(f"PRAGMA user_version={number}")
+        log.info("🗄️ Schema migrated to v%d (%s)", number, migrate.__name__)
+    global DB_WRITER
+    if DB_WRITER is None:
+        DB_WRITER = DbWriter(DB_FILE)
+        DB_WRITER.start()
     return conn
 
-def extract_m3u_urls_from_text(text):
-    urls = set()
-    for line in text.splitlines():
-        line = line.strip()
-        if line.startswith("http") and (".m3u" in line or ".m3u8" in line):
-            urls.add(line)
-        elif "href=" in line:
-            m = re.search(r'href=[\'"]([^\'"]*\.(?:m3u|m3u8))[\'"]', line)
-            if m:
-                urls.add(m.group(1))
-    return urls
+def explain_hot_queries(conn):
+    """Self-check: log EXPLAIN QUERY PLAN for the per-cycle queries and flag full table scans."""
+    for name, (sql, params) in HOT_QUERIES.items():
+        log.info("EXPLAIN %s: %s", name, " ".join(sql.split()))
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            detail = row[-1]
+            if detail.startswith("SCAN") and "INDEX" not in detail:
+                log.warning("    %s  <-- full scan", detail)
+            else:
+                log.info("    %s", detail)
 
-def fetch_metadata_for_title(conn, title):
-    cur = conn.cursor()
-    cur.execute("SELECT json, last_fetched FROM meta_cache WHERE title=?", (title,))
-    row = cur.fetchone()
-    now = int(time.time())
-    if row:
-        j, last = row
-        if now - last < 30 * 24 * 3600:
+def db_read():
+    """Per-thread read-only connection; all writes go through DB_WRITER."""
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = _db_local.conn = sqlite3.connect(DB_FILE.resolve().as_uri() + "?mode=ro", uri=True, timeout=30)
+    return conn
+
+class DbWriter(threading.Thread):
+    """Sole writer of the state db: queued statements and channel checks are group-committed
+    every DB_COMMIT_INTERVAL, consecutive identical statements via executemany."""
+
+    def __init__(self, path):
+        super().__init__(name="db-writer", daemon=True)
+        self.path = path
+        self.queue = queue.Queue()
+
+    def execute(self, sql, params=()):
+        self.queue.put(("sql", sql, params))
+
+    def executemany(self, sql, rows):
+        self.queue.put(("many", sql, list(rows)))
+
+    def record_check(self, url, ok, info, now, latency_ms=None):
+        self.queue.put(("check", None, (url, ok, info, now, latency_ms)))
+
+    def optimize(self):
+        # Refreshes planner stats that the cycle's writes made stale (the migration's ANALYZE ran on a day-one db).
+        self.queue.put(("optimize", None, None))
+
+    def flush(self, timeout=60):
+        done = threading.Event()
+        self.queue.put(("flush", None, done))
+        done.wait(timeout)
+
+    def run(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("PRAGMA journal_size_limit=4194304;")
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + DB_COMMIT_INTERVAL
+            while batch[-1][0] != "flush" and len(batch) < DB_BATCH_MAX:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            groups = [(kind, sql, [item[2] for item in items]) for (kind, sql), items in itertools.groupby(batch, key=lambda item: item[:2])]
             try:
-                return json.loads(j)
-            except Exception:
-                pass
+                with conn:
+                    for group in groups:
+                        self._apply(conn, *group)
+            except sqlite3.Error as e:
+                log.debug("DB batch failed (%s), retrying per statement group", e)
+                for group in groups:
+                    try:
+                        with conn:
+                            self._apply(conn, *group)
+                    except sqlite3.Error as e:
+                        log.warning("DB write dropped (%s): %s", group[1] or group[0], e)
+            for kind, _, items in groups:
+                if kind == "flush":
+                    for done in items:
+                        done.set()
+
+    def _apply(self, conn, kind, sql, items):
+        if kind == "sql":
+            conn.executemany(sql, items)
+        elif kind == "many":
+            for rows in items:
+                conn.executemany(sql, rows)
+        elif kind == "check":
+            apply_checks(conn, items)
+        elif kind == "optimize":
+            conn.execute("PRAGMA optimize")
+
+def load_source_cache(conn):
+    cur = conn.execute("SELECT url, etag, last_modified, body_hash, last_fetched, last_parsed FROM source_cache")
+    return {url: {"etag": etag, "last_modified": lm, "body_hash": h, "last_fetched": lf, "last_parsed": lp}
+            for url, etag, lm, h, lf, lp in cur.fetchall()}
+
+def save_source_cache(cache):
+    rows = [(url, e.get("etag"), e.get("last_modified"), e.get("body_hash"), e.get("last_fetched"), e.get("last_parsed"))
+            for url, e in list(cache.items())]
+    DB_WRITER.executemany("INSERT OR REPLACE INTO source_cache(url, etag, last_modified, body_hash, last_fetched, last_parsed) VALUES (?,?,?,?,?,?)", rows)
+
+def conditional_get(url, cache, timeout=REQUEST_TIMEOUT):
+    """Fetch a source with If-None-Match/If-Modified-Since against `cache`.
+
+    Returns (body, state): body is only set when the content changed and
+    needs parsing, as a spooled file rewound to the start that the caller
+    must close; state is one of "changed", "not-modified", "unchanged",
+    "missing" (404/410) or "error". The body is hashed while it streams in,
+    so large playlists never sit in memory whole. Entries older than
+    SOURCE_CACHE_MAX_AGE are fetched unconditionally.
+    """
+    now = int(time.time())
+    entry = cache.get(url) or {}
+    fresh = now - (entry.get("last_parsed") or 0) < SOURCE_CACHE_MAX_AGE
+    headers = {}
+    if fresh and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if fresh and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    body = tempfile.SpooledTemporaryFile(max_size=SOURCE_SPOOL_BYTES)
+    hasher = hashlib.sha1()
+    try:
+        with http_session().get(url, headers=headers, timeout=timeout, stream=True) as r:
+            if r.status_code == 304:
+                cache[url] = dict(entry, last_fetched=now)
+                body.close()
+                return None, "not-modified"
+            if r.status_code in (404, 410):
+                body.close()
+                return None, "missing"
+            if r.status_code != 200:
+                body.close()
+                return None, "error"
+            for chunk in r.iter_content(STREAM_CHUNK_SIZE):
+                hasher.update(chunk)
+                body.write(chunk)
+            etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+    except Exception as e:
+        log.debug("GET failed %s -> %s", url, e)
+        body.close()
+        return None, "error"
+    if not body.tell():
+        body.close()
+        return None, "error"
+    body_hash = hasher.hexdigest()
+    unchanged = fresh and body_hash == entry.get("body_hash")
+    cache[url] = {
+        "etag": etag,
+        "last_modified": last_modified,
+        "body_hash": body_hash,
+        "last_fetched": now,
+        "last_parsed": entry.get("last_parsed") if unchanged else now,
+    }
+    if unchanged:
+        body.close()
+        return None, "unchanged"
+    body.seek(0)
+    return body, "changed"
+
+# One match per entry: an optional #EXTINF line, any directive/blank lines, then the URL line.
+_M3U_ENTRY_RE = re.compile(rb'^(?:#EXTINF:([^\n]*)\n(?:[ \t\r]*(?:#(?!EXTINF)[^\n]*)?\n)*)?[ \t]*([^#\s][^\r\n]*)', re.M)
+_HREF_M3U_RE = re.compile(rb'href=[\'"]([^\'"]*\.(?:m3u|m3u8))[\'"]')
+_MAX_CARRY_BYTES = 1 << 20
+_URL_SCHEMES = ("http://", "https://", "rtmp://", "rtmps://", "rtsp://", "rtp://", "udp://", "mms://")
+
+class M3UEntry:
+    """One playlist entry: url plus #EXTINF fields, parsed on first access."""
+    __slots__ = ("url", "_info", "_meta")
+
+    def __init__(self, url, info=b""):
+        self.url = url
+        self._info = info
+        self._meta = None
+
+    def _fields(self):
+        if self._meta is None:
+            self._meta = _parse_extinf(self._info)
+        return self._meta
+
+    info = property(lambda self: self._info.decode("utf-8", "replace"))
+    name = property(lambda self: self._fields()[0])
+    tvg_id = property(lambda self: self._fields()[1])
+    tvg_logo = property(lambda self: self._fields()[2])
+    group_title = property(lambda self: self._fields()[3])
+    duration = property(lambda self: self._fields()[4])
+
+def _parse_extinf(info):
+    parts = info.split(b'"')
+    tvg_id = tvg_logo = group = None
+    for i in range(1, len(parts) - 1, 2):
+        key = parts[i - 1]
+        if key.endswith(b"tvg-id="):
+            tvg_id = parts[i].decode("utf-8", "replace") or None
+        elif key.endswith(b"tvg-logo="):
+            tvg_logo = parts[i].decode("utf-8", "replace") or None
+        elif key.endswith(b"group-title="):
+            group = parts[i].decode("utf-8", "replace") or None
+    # The title follows the first comma after the last quoted attribute.
+    tail = parts[-1]
+    comma = tail.find(b",")
+    name = tail[comma + 1:].strip().decode("utf-8", "replace") or None if comma >= 0 else None
+    head = parts[0].split(b",", 1)[0].split(None, 1)
+    try:
+        duration = float(head[0]) if head else -1.0
+    except ValueError:
+        duration = -1.0
+    return name, tvg_id, tvg_logo, group, duration
+
+def iter_file_chunks(f, size=STREAM_CHUNK_SIZE):
+    return iter(lambda: f.read(size), b"")
+
+def _split_complete(buf):
+    """Split buf after its last URL line, so a trailing #EXTINF waits for its URL."""
+    end = buf.rfind(b"\n")
+    while end >= 0:
+        start = buf.rfind(b"\n", 0, end) + 1
+        line = buf[start:end].strip()
+        if line and line[0] != 35:  # not "#"
+            return buf[:end + 1], buf[end + 1:]
+        end = start - 1
+    return b"", buf
+
+def iter_m3u_entries(chunks, base_url="", scan_hrefs=False):
+    """Stream M3UEntry records out of an iterable of bytes chunks.
+
+    Entries are paired by one regex pass per chunk instead of a Python loop
+    per line, and only the unfinished tail is carried into the next chunk,
+    so memory stays flat for any playlist size. Relative URLs are resolved
+    against base_url; with scan_hrefs, href="...m3u" links in HTML pages
+    are yielded too.
+    """
+    carry = b""
+    for chunk in itertools.chain(chunks, (None,)):
+        if chunk is None:
+            region, carry = carry + b"\n", b""
+        elif not chunk:
+            continue
+        else:
+            region, carry = _split_complete(carry + chunk)
+            if len(carry) > _MAX_CARRY_BYTES:
+                carry = b""
+        for info, raw in _M3U_ENTRY_RE.findall(region):
+            if scan_hrefs and b"href=" in raw:
+                for href in _HREF_M3U_RE.findall(raw):
+                    yield M3UEntry(urljoin(base_url, href.decode("utf-8", "replace")))
+                continue
+            url = raw.decode("utf-8", "replace").rstrip()
+            if "://" in url:
+                # Scheme first: skips HTML/markdown/JS lines that merely contain a link.
+                if not url.lower().startswith(_URL_SCHEMES):
+                    continue
+            elif not base_url or " " in url or "<" in url:
+                continue
+            else:
+                url = urljoin(base_url, url)
+            yield M3UEntry(url, info)
+
+def extract_playlist_entries(chunks, base_url=""):
+    """Maps every .m3u/.m3u8 URL (entry line or href=) to its M3UEntry, preferring titled ones."""
+    entries = {}
+    for e in iter_m3u_entries(chunks, base_url, scan_hrefs=True):
+        if ".m3u" in e.url and (e.url not in entries or e.name):
+            entries[e.url] = e
+    return entries
+
+def normalize_title(title):
+    t = re.sub(r'[\(\[][^\)\]]*[\)\]]', ' ', (title or "").lower())
+    return " ".join(re.findall(r'[a-z0-9]+', t))
+
+def build_title_index(conn):
+    """normalized title -> candidate stream URLs, built once per cycle from channels."""
+    index = {}
+    cur = conn.execute(SQL_TITLE_INDEX, (STATUS_FAIL,))
+    for url, title in cur:
+        key = normalize_title(title)
+        if not key:
+            continue
+        bucket = index.setdefault(key, [])
+        if len(bucket) < TITLE_INDEX_MAX_URLS:
+            bucket.append(url)
+    return index
+
+def _meta_lru_get(title):
+    with _meta_lock:
+        if title in _meta_lru:
+            _meta_lru.move_to_end(title)
+            return True, _meta_lru[title]
+    return False, None
+
+def _meta_lru_put(title, data):
+    with _meta_lock:
+        _meta_lru[title] = data
+        _meta_lru.move_to_end(title)
+        while len(_meta_lru) > META_LRU_SIZE:
+            _meta_lru.popitem(last=False)
+
+def load_meta_cache(titles, now=None):
+    """Fresh meta_cache rows for `titles`, one IN (...) query per 500 titles."""
+    now = now or int(time.time())
+    found = {}
+    titles = list(titles)
+    for i in range(0, len(titles), 500):
+        chunk = titles[i:i + 500]
+        cur = db_read().execute(f"SELECT title, json, last_fetched FROM meta_cache WHERE title IN ({','.join('?' * len(chunk))})", chunk)
+        for title, j, last in cur:
+            if now - (last or 0) < META_CACHE_TTL:
+                try:
+                    found[title] = json.loads(j)
+                except Exception:
+                    pass
+    return found
+
+def _meta_rate_wait():
+    global _meta_next_at
+    with _meta_rate_lock:
+        now = time.monotonic()
+        wait = _meta_next_at - now
+        _meta_next_at = max(now, _meta_next_at) + 1.0 / META_FETCH_RATE
+    if wait > 0:
+        time.sleep(wait)
+
+def _fetch_metadata_remote(title):
+    """Web lookup; a dict (Poster may be None) when the search answered, None when the lookup itself failed."""
+    _meta_rate_wait()
     try:
         r = safe_get(f"https://html.duckduckgo.com/html/?q={quote_plus(title + ' poster')}", timeout=8)
         if r:
@@ -398,29 +1215,450 @@ def fetch_metadata_for_title(conn, title):
             img = soup.find("img")
             snippet = soup.find("a")
             data = {"Title": title, "Poster": img.get("src") if img else None, "Plot": snippet.get_text(strip=True) if snippet else None}
-            cur.execute("INSERT OR REPLACE INTO meta_cache(title, json, last_fetched) VALUES (?,?,?)", (title, json.dumps(data), now))
-            conn.commit()
+            DB_WRITER.execute("INSERT OR REPLACE INTO meta_cache(title, json, last_fetched) VALUES (?,?,?)", (title, json.dumps(data), int(time.time())))
             return data
     except Exception as e:
         log.debug("Web fallback error: %s", e)
     return None
 
+def cached_metadata_for_title(title):
+    """LRU -> meta_cache only; never touches the network, so it is safe on validation workers."""
+    hit, data = _meta_lru_get(title)
+    if hit:
+        return data
+    cached = load_meta_cache([title])
+    if title in cached:
+        _meta_lru_put(title, cached[title])
+        return cached[title]
+    return None
+
+def fetch_metadata_for_title(title):
+    # LRU -> meta_cache -> one rate-limited web lookup per title at a time.
+    data = cached_metadata_for_title(title)
+    if data is not None:
+        return data
+    return _fetch_missing(title)
+
+def _fetch_missing(title):
+    # For titles already known to be missing from meta_cache: LRU, in-flight dedupe, web lookup; no DB read.
+    # A failed lookup is not a miss: the title is retried after META_ERROR_RETRY.
+    hit, data = _meta_lru_get(title)
+    if hit:
+        return data
+    if _meta_errors.get(title, 0) > time.time():
+        return None
+    with _meta_lock:
+        fut = _meta_inflight.get(title)
+        owner = fut is None
+        if owner:
+            fut = _meta_inflight[title] = Future()
+    if not owner:
+        return fut.result()
+    data = None
+    try:
+        data = _fetch_metadata_remote(title)
+    finally:
+        with _meta_lock:
+            _meta_inflight.pop(title, None)
+            if data is None:
+                now = time.time()
+                if len(_meta_errors) >= META_LRU_SIZE:
+                    for t in [t for t, until in _meta_errors.items() if until <= now]:
+                        del _meta_errors[t]
+                _meta_errors[title] = now + META_ERROR_RETRY
+            else:
+                _meta_errors.pop(title, None)
+        if data is not None:
+            _meta_lru_put(title, data)
+        fut.set_result(data)
+    return data
+
+def enrich_metadata(titles):
+    titles = [t for t in dict.fromkeys(titles) if t and not _meta_lru_get(t)[0]]
+    cached = load_meta_cache(titles)
+    for title, data in cached.items():
+        _meta_lru_put(title, data)
+    misses = [t for t in titles if t not in cached]
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=META_FETCH_WORKERS) as ex:
+        fetched = sum(1 for data in ex.map(_fetch_missing, misses) if data)
+    log.info("🖼️ Metadata: %d titles, %d from cache, %d/%d fetched in %.1fs", len(titles), len(cached), fetched, len(misses), time.time() - started)
+
+def start_metadata_enrichment(titles):
+    """Run enrich_metadata in the background; skipped while the previous run is still going."""
+    global _enrich_thread
+    if _enrich_thread is not None and _enrich_thread.is_alive():
+        log.info("🖼️ Metadata enrichment still running, skipping this cycle")
+        return
+    _enrich_thread = threading.Thread(target=enrich_metadata, args=(titles,), name="meta-enrich", daemon=True)
+    _enrich_thread.start()
+
+def sniff_media(data):
+    """Name the container `data` starts with (mpegts, hls, id3, adts, fmp4), or None."""
+    head = data.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if head.startswith(b"#EXTM3U"):
+        return "hls"
+    if data[:3] == b"ID3":
+        return "id3"
+    if data[4:8] in FMP4_BOXES:
+        return "fmp4"
+    if len(data) >= 2 and data[0] == 0xFF and data[1] & 0xF6 == 0xF0:
+        return "adts"
+    # TS: the 0x47 sync byte repeating at a 188-byte stride, from any offset within the first packet.
+    i = data.find(b"\x47", 0, 188)
+    while i != -1 and i + 376 < len(data):
+        if data[i + 188] == 0x47 and data[i + 376] == 0x47:
+            return "mpegts"
+        i = data.find(b"\x47", i + 1, 188)
+    return None
+
+def probe_media(url, timeout=VALIDATE_TIMEOUT):
+    """Range-GET at most SNIFF_BYTES of `url` and sniff them; the response is always closed."""
+    data = b""
+    with http_session().get(url, headers={"Range": f"bytes=0-{SNIFF_BYTES - 1}"}, timeout=timeout, stream=True) as r:
+        if r.status_code not in (200, 206):
+            return None, r.status_code
+        for chunk in r.iter_content(1024):
+            data += chunk
+            kind = sniff_media(data)
+            if kind or len(data) >= SNIFF_BYTES:
+                return kind, r.status_code
+    return sniff_media(data), r.status_code
+
+_HLS_ATTR_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+def fetch_capped(url, cap, timeout=DEEP_PROBE_TIMEOUT):
+    """GET at most `cap` bytes; returns (data, status, final url, ttfb seconds, total seconds)."""
+    started = time.monotonic()
+    data = b""
+    with http_session().get(url, timeout=timeout, stream=True) as r:
+        ttfb = time.monotonic() - started
+        if r.status_code in (200, 206):
+            for chunk in r.iter_content(16 * 1024):
+                data += chunk
+                if len(data) >= cap:
+                    break
+        return data[:cap], r.status_code, r.url, ttfb, time.monotonic() - started
+
+def parse_hls_playlist(text, base_url):
+    """(variants, segments, live) of an HLS playlist; variants are (bandwidth, resolution, url)."""
+    variants, segments = [], []
+    attrs = None
+    expect_segment = False
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            attrs = dict((k, v.strip('"')) for k, v in _HLS_ATTR_RE.findall(line[18:]))
+        elif line.startswith("#EXTINF:"):
+            expect_segment = True
+        elif line and not line.startswith("#"):
+            if attrs is not None:
+                bandwidth = attrs.get("BANDWIDTH", "")
+                variants.append((int(bandwidth) if bandwidth.isdigit() else 0, attrs.get("RESOLUTION"), urljoin(base_url, line)))
+                attrs = None
+            elif expect_segment:
+                segments.append(urljoin(base_url, line))
+                expect_segment = False
+    return variants, segments, "#EXT-X-ENDLIST" not in text
+
+def deep_probe_hls(url):
+    """Master -> highest-bandwidth variant -> one media segment (live edge, or first for VOD), byte-capped.
+
+    Returns (ok, metrics) where metrics is the JSON stored in channels.info.
+    """
+    metrics = {"probe": "hls"}
+    try:
+        data, status, final, ttfb, _ = fetch_capped(url, DEEP_PROBE_PLAYLIST_BYTES)
+        metrics["ttfb_ms"] = int(ttfb * 1000)
+        if status not in (200, 206):
+            metrics["error"] = f"playlist-{status}"
+            return False, metrics
+        variants, segments, live = parse_hls_playlist(data.decode("utf-8", "ignore"), final)
+        if variants:
+            bandwidth, resolution, variant = max(variants, key=lambda v: v[0])
+            metrics.update(variants=len(variants), bandwidth=bandwidth, resolution=resolution)
+            data, status, final, _, _ = fetch_capped(variant, DEEP_PROBE_PLAYLIST_BYTES)
+            if status not in (200, 206):
+                metrics["error"] = f"variant-{status}"
+                return False, metrics
+            _, segments, live = parse_hls_playlist(data.decode("utf-8", "ignore"), final)
+        metrics["live"] = live
+        if not segments:
+            metrics["error"] = "no-segments"
+            return False, metrics
+        # Players start about three segments from the live edge; the oldest ones may already be gone.
+        segment = segments[max(0, len(segments) - 3)] if live else segments[0]
+        data, status, _, seg_ttfb, elapsed = fetch_capped(segment, DEEP_PROBE_SEGMENT_BYTES)
+        metrics.update(segment_status=status, segment_ttfb_ms=int(seg_ttfb * 1000), segment_bytes=len(data), segment_kind=sniff_media(data))
+        if status not in (200, 206) or not data:
+            metrics["error"] = f"segment-{status}"
+            return False, metrics
+        metrics["kbps"] = int(len(data) * 8 / max(elapsed - seg_ttfb, 0.001) / 1000)
+        return True, metrics
+    except Exception as e:
+        metrics["error"] = type(e).__name__
+        return False, metrics
+
+def deepen_result(result):
+    # Opt-in (DEEP_PROBE): an HLS pass from the sniffer is only kept if a variant and a segment load too.
+    ok, info, final, latency_ms = result
+    if not (DEEP_PROBE and ok and info == "sniff-hls"):
+        return result
+    ok, metrics = deep_probe_hls(final)
+    return ok, json.dumps(metrics, separators=(",", ":")), final, latency_ms if ok else None
+
+def elapsed_ms(started):
+    return int((time.monotonic() - started) * 1000)
+
+def connect_failure_kind(exc):
+    """"dns", "timeout" or "connect" for a connection-level error, looking through wrapped causes."""
+    stack, seen = [exc], set()
+    kind = "connect"
+    while stack:
+        e = stack.pop()
+        if e is None or id(e) in seen:
+            continue
+        seen.add(id(e))
+        if isinstance(e, socket.gaierror):
+            return "dns"
+        if isinstance(e, (TimeoutError, asyncio.TimeoutError, requests.exceptions.Timeout)):
+            kind = "timeout"
+        stack.extend((e.__cause__, e.__context__, getattr(e, "reason", None), getattr(e, "os_error", None)))
+        stack.extend(a for a in getattr(e, "args", ()) if isinstance(a, BaseException))
+    return kind
+
+class HostHealth:
+    """Per-host circuit breaker for validation.
+
+    HOST_FAIL_THRESHOLD connection-level failures in a row (DNS, refused, timeout) open
+    the breaker: URLs on that host fail fast with HOST_OPEN_INFO instead of each waiting
+    out VALIDATE_TIMEOUT. After the cooldown one caller gets through as a half-open
+    probe; success closes the breaker, failure reopens it with the cooldown doubled
+    (up to HOST_OPEN_MAX). Any HTTP response counts as the host being up.
+    """
+    def __init__(self):
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self.fast_fails = 0
+
+    @staticmethod
+    def key(url):
+        return urlsplit(url).netloc.lower().rsplit("@", 1)[-1]
+
+    def _entry(self, host):
+        entry = self._hosts.get(host)
+        if entry is None:
+            entry = self._hosts[host] = {"state": "closed", "fails": 0, "until": 0.0, "cooldown": HOST_OPEN_SECONDS,
+                                         "probe_at": 0.0, "dns": 0, "connect": 0, "timeout": 0}
+        return entry
+
+    def allow(self, url):
+        now = time.time()
+        with self._lock:
+            entry = self._entry(self.key(url))
+            if entry["state"] == "closed":
+                return True
+            # A probe that never reported back (worker died) stops blocking after two timeouts.
+            if now >= entry["until"] and (entry["state"] == "open" or now - entry["probe_at"] > 2 * VALIDATE_TIMEOUT):
+                entry["state"] = "half-open"
+                entry["probe_at"] = now
+                return True
+            self.fast_fails += 1
+            return False
+
+    def record(self, url, failure=None):
+        """failure is None when the host answered, else the connect_failure_kind."""
+        host = self.key(url)
+        with self._lock:
+            entry = self._entry(host)
+            if failure is None:
+                if entry["state"] != "closed":
+                    log.info("⚡ Host %s is back, closing its breaker", host)
+                entry.update(state="closed", fails=0, cooldown=HOST_OPEN_SECONDS)
+                return
+            entry[failure] += 1
+            entry["fails"] += 1
+            if entry["state"] == "half-open":
+                entry["cooldown"] = min(entry["cooldown"] * 2, HOST_OPEN_MAX)
+            elif entry["state"] == "open" or entry["fails"] < HOST_FAIL_THRESHOLD:
+                return
+            entry.update(state="open", until=time.time() + entry["cooldown"])
+            log.warning("⚡ Host %s down (%d failures, last: %s), failing its URLs fast for %ds", host, entry["fails"], failure, entry["cooldown"])
+
+    def retry_at(self, url):
+        with self._lock:
+            entry = self._hosts.get(self.key(url))
+            return int(max(entry["until"] if entry else 0, time.time()))
+
+    def log_summary(self):
+        with self._lock:
+            down = [h for h, e in self._hosts.items() if e["state"] != "closed"]
+            fast_fails, self.fast_fails = self.fast_fails, 0
+        if down or fast_fails:
+            log.info("⚡ Host breaker: %d hosts down (%s), %d URLs failed fast this cycle", len(down), ", ".join(sorted(down)[:5]), fast_fails)
+
+HOST_OPEN_INFO = "host-open"
+HOST_HEALTH = HostHealth()
+
 def validate_url_pipeline(url):
+    """(ok, info, final url, latency_ms); latency is the time to a positive answer, None on failure."""
+    # VALIDATE_SNIFF checks the first bytes instead of trusting Content-Type (text/plain TS is common).
     final = expand_short_url(url)
+    if not HOST_HEALTH.allow(final):
+        return False, HOST_OPEN_INFO, final, None
+    started = time.monotonic()
+    failure = None
+    answered = False
     try:
-        r = requests.head(final, headers=HEADERS, timeout=8, allow_redirects=True)
-        if r and 200 <= r.status_code < 400:
-            ct = (r.headers.get("Content-Type") or "").lower()
-            if any(k in ct for k in ("mpeg", "video", "audio", "apple.mpegurl", "x-mpegurl", "octet-stream")):
-                return True, f"head-{r.status_code}", final
-        r2 = requests.get(final, headers=HEADERS, timeout=8, stream=True)
-        if r2 and r2.status_code == 200:
-            ct = (r2.headers.get("Content-Type") or "").lower()
-            if any(k in ct for k in ("mpeg", "video", "audio", "apple.mpegurl", "x-mpegurl")):
-                return True, "get-ok", final
+        if VALIDATE_SNIFF:
+            kind, status = probe_media(final)
+            answered = True
+            if kind:
+                return deepen_result((True, f"sniff-{kind}", final, elapsed_ms(started)))
+            return False, "fail", final, None
+        with http_session().head(final, timeout=VALIDATE_TIMEOUT, allow_redirects=True) as r:
+            answered = True
+            if 200 <= r.status_code < 400:
+                ct = (r.headers.get("Content-Type") or "").lower()
+                if any(k in ct for k in HEAD_MEDIA_TYPES):
+                    return True, f"head-{r.status_code}", final, elapsed_ms(started)
+        with http_session().get(final, timeout=VALIDATE_TIMEOUT, stream=True) as r2:
+            if r2.status_code == 200:
+                ct = (r2.headers.get("Content-Type") or "").lower()
+                if any(k in ct for k in GET_MEDIA_TYPES):
+                    return True, "get-ok", final, elapsed_ms(started)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        failure = connect_failure_kind(e)
     except Exception:
         pass
-    return False, "fail", final
+    finally:
+        # Only a response proves the host up; a local error (decode, parsing) says nothing about it.
+        if answered or failure:
+            HOST_HEALTH.record(final, None if answered else failure)
+    return False, "fail", final, None
+
+async def expand_short_url_async(session, url):
+    if any(x in url for x in SHORTENER_HOSTS):
+        try:
+            async with session.head(url, allow_redirects=True) as r:
+                if r.status in (200, 301, 302, 303, 307, 308):
+                    return str(r.url)
+        except Exception:
+            pass
+    return url
+
+async def validate_url_async(session, url, global_limit, host_limits):
+    """Async twin of validate_url_pipeline: same checks, same (ok, info, final, latency_ms) result."""
+    async with global_limit:
+        final = await expand_short_url_async(session, url)
+    host = urlparse(final).hostname or ""
+    host_limit = host_limits.setdefault(host, asyncio.Semaphore(ASYNC_PER_HOST_LIMIT))
+    # Host slot is taken before the global one so a crowded host never parks global capacity.
+    async with host_limit, global_limit:
+        # Checked once a host slot is free, so URLs queued behind a dying host's first few fail fast.
+        if not HOST_HEALTH.allow(final):
+            return False, HOST_OPEN_INFO, final, None
+        started = time.monotonic()
+        failure = None
+        answered = False
+        try:
+            if VALIDATE_SNIFF:
+                # Leaving the block with the body unread drops the connection rather than draining a live stream.
+                async with session.get(final, headers={"Range": f"bytes=0-{SNIFF_BYTES - 1}"}) as r:
+                    answered = True
+                    if r.status in (200, 206):
+                        data = b""
+                        while len(data) < SNIFF_BYTES:
+                            chunk = await r.content.read(SNIFF_BYTES - len(data))
+                            if not chunk:
+                                break
+                            data += chunk
+                            kind = sniff_media(data)
+                            if kind:
+                                return True, f"sniff-{kind}", final, elapsed_ms(started)
+                return False, "fail", final, None
+            async with session.head(final, allow_redirects=True) as r:
+                answered = True
+                if 200 <= r.status < 400:
+                    ct = (r.headers.get("Content-Type") or "").lower()
+                    if any(k in ct for k in HEAD_MEDIA_TYPES):
+                        return True, f"head-{r.status}", final, elapsed_ms(started)
+            async with session.get(final) as r2:
+                if r2.status == 200:
+                    ct = (r2.headers.get("Content-Type") or "").lower()
+                    if any(k in ct for k in GET_MEDIA_TYPES):
+                        return True, "get-ok", final, elapsed_ms(started)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            failure = connect_failure_kind(e)
+        except Exception:
+            pass
+        finally:
+            if answered or failure:
+                HOST_HEALTH.record(final, None if answered else failure)
+    return False, "fail", final, None
+
+async def validate_urls_async(urls):
+    results = {}
+    global_limit = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+    host_limits = {}
+    timeout = aiohttp.ClientTimeout(total=VALIDATE_TIMEOUT)
+    connector = aiohttp.TCPConnector(limit=ASYNC_MAX_CONCURRENCY, limit_per_host=ASYNC_PER_HOST_LIMIT, resolver=CachedResolver())
+    async with aiohttp.ClientSession(headers=HEADERS, timeout=timeout, connector=connector) as session:
+        async def run(url):
+            results[url] = await validate_url_async(session, url, global_limit, host_limits)
+        await asyncio.gather(*(run(u) for u in urls))
+    return results
+
+def canonical_url(url):
+    """Lower-cased scheme/host, no default port, fragment, tracking params or trailing slash."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    netloc = host if port in (None, DEFAULT_PORTS.get(scheme)) else f"{host}:{port}"
+    if parts.username:
+        netloc = f"{parts.username}:{parts.password}@{netloc}" if parts.password else f"{parts.username}@{netloc}"
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in TRACKING_PARAMS])
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+def url_fingerprint(url):
+    # Scheme-free canonical form, so http:// and https:// to the same host/path collapse too.
+    canonical = canonical_url(url)
+    return canonical.split("://", 1)[-1]
+
+def dedupe_discovered(conn, discovered):
+    """Drop candidates equivalent to an earlier one in this batch or to a channel already stored under another URL."""
+    kept, stats = {}, {"discovered": len(discovered), "batch_duplicates": 0, "known_duplicates": 0}
+    by_fp = {}
+    for url, entry in discovered.items():
+        fp = url_fingerprint(url)
+        if fp in by_fp:
+            stats["batch_duplicates"] += 1
+            continue
+        by_fp[fp] = url
+    fps, stored = list(by_fp), {}
+    for i in range(0, len(fps), 500):
+        chunk = fps[i:i + 500]
+        for fp, url in conn.execute(SQL_FINGERPRINTS.format(",".join("?" * len(chunk))), chunk):
+            stored.setdefault(fp, set()).add(url)
+    for fp, urls in stored.items():
+        if by_fp[fp] in urls:
+            continue
+        # Prefer the stored URL when it was rediscovered too, so its row still gets the metadata refresh.
+        rediscovered = next((u for u in urls if u in discovered), None)
+        if rediscovered:
+            by_fp[fp] = rediscovered
+        else:
+            del by_fp[fp]
+            stats["known_duplicates"] += 1
+    for fp, url in by_fp.items():
+        kept[url] = (discovered[url], fp)
+    stats["kept"] = len(kept)
+    return kept, stats
 
 def guess_title_from_url(url):
     p = urlparse(url).path
@@ -431,22 +1669,121 @@ def guess_title_from_url(url):
         return name if name else None
     return None
 
-def discover_from_all_sources():
-    found = set()
-    for src in ALL_SOURCES:
-        try:
-            r = safe_get(src)
-            if r and r.status_code == 200 and r.text:
-                found.update(extract_m3u_urls_from_text(r.text))
-            elif "github.com" in src and src.endswith(".git"):
+class OriginScheduler:
+    """Hands tasks to `executor` with at most `per_origin` running per origin at a time.
+
+    The rest wait in a per-origin queue rather than in a worker thread, so a slow origin
+    with hundreds of URLs never ties up the pool while other hosts have work ready.
+    submit() returns a Future that settles with the task's own result.
+    """
+    def __init__(self, executor, per_origin=DISCOVERY_PER_ORIGIN):
+        self.executor = executor
+        self.per_origin = per_origin
+        self._lock = threading.Lock()
+        self._running = {}
+        self._waiting = {}
+
+    def submit(self, url, fn, *args):
+        future = Future()
+        origin = urlparse(url).netloc.lower()
+        with self._lock:
+            start = self._running.get(origin, 0) < self.per_origin
+            if start:
+                self._running[origin] = self._running.get(origin, 0) + 1
+            else:
+                self._waiting.setdefault(origin, deque()).append((future, fn, args))
+        if start:
+            self._start(origin, future, fn, args)
+        return future
+
+    def _start(self, origin, future, fn, args):
+        self.executor.submit(fn, *args).add_done_callback(lambda inner: self._finish(origin, future, inner))
+
+    def _finish(self, origin, future, inner):
+        with self._lock:
+            waiting = self._waiting.get(origin)
+            following = waiting.popleft() if waiting else None
+            if following is None:
+                self._running[origin] -= 1
+        if following is not None:
+            self._start(origin, *following)
+        if inner.exception() is not None:
+            future.set_exception(inner.exception())
+        else:
+            future.set_result(inner.result())
+
+def load_repo_paths(conn):
+    paths = {}
+    for repo, url, ok, checked_at in conn.execute("SELECT repo, url, ok, checked_at FROM repo_paths").fetchall():
+        paths.setdefault(repo, {})[url] = (bool(ok), checked_at)
+    return paths
+
+def save_repo_paths(paths):
+    rows = [(repo, url, int(ok), checked_at) for repo, known in list(paths.items()) for url, (ok, checked_at) in list(known.items())]
+    DB_WRITER.executemany("INSERT OR REPLACE INTO repo_paths(repo, url, ok, checked_at) VALUES (?,?,?,?)", rows)
+
+def resolve_repo_urls(repo, paths, now=None):
+    """Known-good raw paths for `repo`, plus unprobed or expired-miss guesses."""
+    now = now or int(time.time())
+    known = paths.get(repo, {})
+    urls = [url for url, (ok, _) in known.items() if ok]
+    for base in REPO_BASES:
+        for file in REPO_FILES:
+            url = base.format(repo=repo) + file
+            if url not in known or (not known[url][0] and now - known[url][1] >= REPO_MISS_TTL):
+                urls.append(url)
+    return urls
+
+def record_repo_probe(paths, repo, url, state):
+    # Transient errors are not recorded, so the path is simply tried again next cycle.
+    if state == "error":
+        return
+    paths.setdefault(repo, {})[url] = (state != "missing", int(time.time()))
+
+def _discover_source(src, cache):
+    body, state = conditional_get(src, cache)
+    if not body:
+        return {}, state
+    with body:
+        return extract_playlist_entries(iter_file_chunks(body), src), state
+
+def _discover_repo_path(repo, url, cache, repo_paths):
+    urls, state = _discover_source(url, cache)
+    record_repo_probe(repo_paths, repo, url, state)
+    return urls, state
+
+def discover_from_all_sources(source_cache=None, repo_paths=None):
+    """Returns {url: M3UEntry} for every playlist URL found in ALL_SOURCES."""
+    found = {}
+    cache = source_cache if source_cache is not None else {}
+    repo_paths = repo_paths if repo_paths is not None else {}
+    states = {"changed": 0, "not-modified": 0, "unchanged": 0, "missing": 0, "error": 0}
+    started = time.time()
+    repo_requests = 0
+    with ThreadPoolExecutor(max_workers=DISCOVERY_WORKERS) as ex:
+        scheduler = OriginScheduler(ex)
+        futures = {}
+        for src in ALL_SOURCES:
+            if "github.com" in src and src.endswith(".git"):
                 repo = src.replace(".git", "").replace("https://github.com/", "")
-                for base in [f"https://raw.githubusercontent.com/{repo}/main/", f"https://raw.githubusercontent.com/{repo}/master/", f"https://cdn.jsdelivr.net/gh/{repo}/"]:
-                    for file in ["playlist.m3u", "index.m3u", "movies.m3u", "series.m3u", "playlist.m3u8", "index.m3u8"]:
-                        r2 = safe_get(base + file)
-                        if r2 and r2.text:
-                            found.update(extract_m3u_urls_from_text(r2.text))
-        except Exception as e:
-            log.debug("discover_from_all_sources fail %s -> %s", src, e)
+                for url in resolve_repo_urls(repo, repo_paths):
+                    futures[scheduler.submit(url, _discover_repo_path, repo, url, cache, repo_paths)] = url
+                    repo_requests += 1
+            else:
+                futures[scheduler.submit(src, _discover_source, src, cache)] = src
+        for fut in as_completed(futures):
+            try:
+                urls, state = fut.result()
+            except Exception as e:
+                log.debug("discover_from_all_sources fail %s -> %s", futures[fut], e)
+                continue
+            states[state] += 1
+            for url, entry in urls.items():
+                if url not in found or entry.name:
+                    found[url] = entry
+    log.info("Source cache: %d changed, %d not-modified, %d unchanged, %d missing, %d errors", states["changed"], states["not-modified"], states["unchanged"], states["missing"], states["error"])
+    log.info("Repo resolver: %d raw paths requested", repo_requests)
+    log.info("Discovery fan-out finished in %.1fs (%d candidates)", time.time() - started, len(found))
     return found
 
 def discover_with_search_engines(query, limit_each=30):
@@ -500,7 +1837,8 @@ def ensure_playlist_header(path=LOCAL_PLAYLIST):
 
 def append_to_playlist(url, title=None, logo=None, path=LOCAL_PLAYLIST):
     global WRITTEN_CHANNELS
-    if url in WRITTEN_CHANNELS: return False
+    # add() claims the URL atomically, so two workers finding the same stream cannot both append it.
+    if not WRITTEN_CHANNELS.add(url): return False
     with open(path, "a", encoding="utf-8") as f:
         if title or logo:
             attrs = []
@@ -512,95 +1850,271 @@ def append_to_playlist(url, title=None, logo=None, path=LOCAL_PLAYLIST):
                 f.write(f'#EXTINF:-1,{title or url}\n{url}\n')
         else:
             f.write(f'{url}\n')
-    WRITTEN_CHANNELS.add(url)
     log.info("✅ ADDED to playlist: %s", title or url[:50])
     return True
 
-def validate_and_maybe_replace(conn, url, title):
+def next_check_delay(ok, fail_streak, checks, oks):
+    # Channels that have worked before but keep dropping out are retried/rechecked sooner than
+    # steady ones; never-working URLs back off exponentially towards RETRY_MAX_INTERVAL.
+    flaky = checks and oks and oks / checks < FLAKY_OK_RATIO
+    if ok:
+        delay = RECHECK_FLAKY_INTERVAL if flaky else RECHECK_OK_INTERVAL
+    elif oks:
+        delay = min(RETRY_BASE_INTERVAL * 2 ** (fail_streak - 1), FLAKY_RETRY_MAX_INTERVAL)
+    else:
+        delay = min(RETRY_BASE_INTERVAL * 2 ** (fail_streak - 1), RETRY_MAX_INTERVAL)
+    return int(delay * random.uniform(1 - SCHEDULE_JITTER, 1 + SCHEDULE_JITTER))
+
+def apply_checks(conn, checks):
+    """Fold (url, ok, info, now, latency_ms) check results into channels; runs inside the DB writer's transaction."""
+    urls = list({check[0] for check in checks})
+    state = {}
+    for i in range(0, len(urls), 500):
+        chunk = urls[i:i + 500]
+        cur = conn.execute(SQL_CHECK_STATE.format(",".join("?" * len(chunk))), chunk)
+        for url, fail_streak, n, oks in cur:
+            state[url] = (fail_streak or 0, n or 0, oks or 0)
+    rows = []
+    for url, ok, info, now, latency_ms in checks:
+        fail_streak, n, oks = state.get(url, (0, 0, 0))
+        fail_streak = 0 if ok else fail_streak + 1
+        n += 1
+        oks += 1 if ok else 0
+        state[url] = (fail_streak, n, oks)
+        # Re-adding a URL the filter already holds would only inflate its count and rotate it early.
+        if fail_streak >= DEAD_AFTER_FAILS and url not in DEAD_URLS:
+            DEAD_URLS.add(url)
+        rows.append((STATUS_OK if ok else STATUS_FAIL, now, info, now + next_check_delay(ok, fail_streak, n, oks), fail_streak, n, oks,
+                     latency_ms, info_kbps(info), url))
+    conn.executemany("UPDATE channels SET status=?, last_checked=?, info=?, next_check=?, fail_streak=?, checks=?, oks=?, "
+                     "latency_ms=COALESCE(?, latency_ms), kbps=COALESCE(?, kbps) WHERE url=?", rows)
+
+def info_kbps(info):
+    # Deep-probe results carry measured throughput as JSON in info.
+    if info and info.startswith("{"):
+        try:
+            return json.loads(info).get("kbps")
+        except ValueError:
+            pass
+    return None
+
+def select_due_channels(conn, now, limit=VALIDATION_BUDGET):
+    # New rows carry next_check=0, so they come first, then the most overdue.
+    cur = conn.execute(SQL_DUE_CHANNELS, (now, limit))
+    return cur.fetchall()
+
+def validate_and_maybe_replace(url, title, result=None, title_index=None):
     global WRITTEN_CHANNELS
-    cur = conn.cursor()
-    ok, info, final = validate_url_pipeline(url)
+    ok, info, final, latency_ms = deepen_result(result) if result else validate_url_pipeline(url)
     now = int(time.time())
+    if info == HOST_OPEN_INFO:
+        # Not this URL's failure: no check is recorded, it is just looked at again once its host may be back.
+        DB_WRITER.execute("UPDATE channels SET next_check=? WHERE url=?", (HOST_HEALTH.retry_at(final), url))
+        return
     if ok:
-        cur.execute("UPDATE channels SET status=?, last_checked=?, info=? WHERE url=?", ("ok", now, info, url))
-        conn.commit()
+        DB_WRITER.record_check(url, True, info, now, latency_ms)
         if not title:
-            cur.execute("SELECT title FROM channels WHERE url=?", (url,))
-            t = cur.fetchone()
-            if not t or not t[0]:
-                maybe_title = guess_title_from_url(url)
-                if maybe_title:
-                    cur.execute("UPDATE channels SET title=? WHERE url=?", (maybe_title, url))
-                    conn.commit()
-                    title = maybe_title
+            maybe_title = guess_title_from_url(url)
+            if maybe_title:
+                DB_WRITER.execute("UPDATE channels SET title=?, title_guessed=1 WHERE url=? AND title IS NULL", (maybe_title, url))
+                title = maybe_title
         logo = None
         if title:
-            meta = fetch_metadata_for_title(conn, title)
+            meta = cached_metadata_for_title(title)
             if meta:
                 logo = meta.get("Poster") or meta.get("poster") or None
-        append_to_playlist(final, title, logo)
+        # The db url, not the redirect target: write_ranked_playlist emits channels by url, and an expanded
+        # `final` it does not know would be carried over as an extra entry for the same channel.
+        append_to_playlist(url, title, logo)
     else:
         log.debug("❌ Validation failed: %s", url[:200])
-        cur.execute("SELECT title FROM channels WHERE url=?", (url,))
-        row = cur.fetchone()
-        channel_title = (row[0] if row and row[0] else title)
         found_repl = False
-        if channel_title:
-            candidates = []
-            for src in ALL_SOURCES:
-                try:
-                    r = safe_get(src, timeout=8)
-                    if r and r.text and channel_title.lower() in r.text.lower():
-                        candidates.extend(extract_m3u_urls_from_text(r.text))
-                except Exception:
-                    pass
-            q = f'"{channel_title}" m3u playlist'
-            candidates.extend(discover_with_search_engines(q))
+        if title and title_index:
+            candidates = title_index.get(normalize_title(title), [])
             for cand in candidates:
-                if cand in WRITTEN_CHANNELS: continue
-                ok2, info2, final2 = validate_url_pipeline(cand)
+                if cand == url or cand in WRITTEN_CHANNELS or cand in DEAD_URLS: continue
+                ok2, info2, final2, latency2 = validate_url_pipeline(cand)
                 if ok2:
-                    cur.execute("UPDATE channels SET status=?, last_checked=?, info=? WHERE url=?", ("fail", now, info, url))
-                    cur.execute("INSERT INTO channels(url, title, logo, status, last_checked, info) VALUES (?,?,?,?,?,?) ON CONFLICT(url) DO UPDATE SET status=excluded.status, last_checked=excluded.last_checked, info=excluded.info", (final2, channel_title, None, "ok", now, info2))
-                    conn.commit()
+                    DB_WRITER.record_check(url, False, info, now)
+                    DB_WRITER.execute("INSERT INTO channels(url, title, logo, fingerprint, status, last_checked) VALUES (?,?,?,?,?,?) ON CONFLICT(url) DO NOTHING", (final2, title, None, url_fingerprint(final2), STATUS_NEW, now))
+                    DB_WRITER.record_check(final2, True, info2, now, latency2)
                     logo = None
-                    meta = fetch_metadata_for_title(conn, channel_title)
+                    meta = cached_metadata_for_title(title)
                     if meta: logo = meta.get("Poster") or meta.get("poster")
-                    append_to_playlist(final2, channel_title, logo)
+                    append_to_playlist(final2, title, logo)
                     found_repl = True
                     log.info("🔄 Replaced: %s ➡ %s", url[:60], final2[:60])
                     break
         if not found_repl:
-            cur.execute("UPDATE channels SET status=?, last_checked=?, info=? WHERE url=?", ("fail", now, info, url))
-            conn.commit()
+            DB_WRITER.record_check(url, False, info, now)
 
 def load_existing_playlist_channels(path=LOCAL_PLAYLIST):
     global WRITTEN_CHANNELS
     if path.exists():
-        with open(path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if line.startswith("http"):
-                    WRITTEN_CHANNELS.add(line)
+        with open(path, "rb") as f:
+            WRITTEN_CHANNELS.update(e.url for e in iter_m3u_entries(iter_file_chunks(f)))
     log.info("Initialized WRITTEN_CHANNELS with %d existing URLs", len(WRITTEN_CHANNELS))
 
-def fetch_epg_all():
+def channel_identity(url, title, tvg_id, title_guessed=False):
+    # tvg-id first, then a playlist-supplied title; guessed titles ("Index") and untitled entries only match their own URL.
+    if tvg_id:
+        return "id:" + tvg_id.strip().lower()
+    key = None if title_guessed else normalize_title(title)
+    if key:
+        return "t:" + key
+    return "u:" + url_fingerprint(url)
+
+def mirror_score(latency_ms, kbps, checks, oks):
+    """Higher is better: smoothed uptime, discounted by start-up latency and (when deep-probed) low throughput."""
+    uptime = ((oks or 0) + 1) / ((checks or 0) + 2)
+    speed = 1 / (1 + (latency_ms if latency_ms is not None else 2000) / 1000)
+    throughput = min(kbps / 4000, 1) if kbps else 0.5
+    return uptime * (0.4 + 0.6 * speed) * (0.75 + 0.25 * throughput)
+
+def unknown_playlist_entries(conn, path):
+    """Entries of the current playlist with no channels row at all (added by hand or by older versions)."""
+    if not path.exists():
+        return []
+    kept = []
+    with open(path, "rb") as f:
+        for batch in iter(lambda: list(itertools.islice(iter_m3u_entries(iter_file_chunks(f)), 500)), []):
+            urls = [e.url for e in batch]
+            known = {url for url, in conn.execute(f"SELECT url FROM channels WHERE url IN ({','.join('?' * len(urls))})", urls)}
+            kept.extend(e for e in batch if e.url not in known)
+    return kept
+
+def write_ranked_playlist(conn, path=LOCAL_PLAYLIST, per_channel=MIRRORS_PER_CHANNEL):
+    """Rewrite the playlist from 'ok' channels grouped by identity, best mirror first, at most `per_channel` each (0 = all).
+
+    Entries of the old playlist that the db knows nothing about are carried over unchanged after them.
+    """
+    global WRITTEN_CHANNELS
+    groups = {}
+    for url, title, title_guessed, logo, tvg_id, latency_ms, kbps, checks, oks in conn.execute(SQL_RANKED_CHANNELS):
+        groups.setdefault(channel_identity(url, title, tvg_id, title_guessed), []).append(
+            (mirror_score(latency_ms, kbps, checks, oks), url, title, logo, tvg_id))
+    unknown = unknown_playlist_entries(conn, path)
+    tmp = path.with_name(path.name + ".tmp")
+    written = 0
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("#EXTM3U\n")
+        for key in sorted(groups, key=lambda k: (k.startswith("u:"), k)):
+            mirrors = sorted(groups[key], reverse=True)
+            for score, url, title, logo, tvg_id in mirrors[:per_channel or None]:
+                if not logo and title:
+                    logo = (_meta_lru_get(title)[1] or {}).get("Poster")
+                attrs = "".join(f' {k}="{v}"' for k, v in (("tvg-id", tvg_id), ("tvg-logo", logo)) if v)
+                f.write(f"#EXTINF:-1{attrs},{title or url}\n{url}\n")
+                written += 1
+        for entry in unknown:
+            f.write(f"#EXTINF:{entry.info}\n{entry.url}\n" if entry.info else f"{entry.url}\n")
+    os.replace(tmp, path)
+    # Suppressed mirrors count as written too, so they are not re-appended mid-cycle before the next ranking.
+    WRITTEN_CHANNELS = UrlHashSet(itertools.chain((url for mirrors in groups.values() for _, url, _, _, _ in mirrors), (e.url for e in unknown)))
+    log.info("🏁 Ranked playlist: %d channels, %d entries (best %s per channel), %d kept from outside the db",
+             len(groups), written, per_channel or "all", len(unknown))
+
+def parse_xmltv_time(value):
+    # "20240101120000 +0530" -> epoch seconds; a missing offset means UTC.
+    value = (value or "").strip()
+    try:
+        ts = calendar.timegm((int(value[0:4]), int(value[4:6]), int(value[6:8]), int(value[8:10]), int(value[10:12]), int(value[12:14] or 0)))
+    except ValueError:
+        return None
+    offset = value[14:].strip()
+    if len(offset) == 5 and offset[0] in "+-" and offset[1:].isdigit():
+        seconds = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+        ts -= seconds if offset[0] == "+" else -seconds
+    return ts
+
+def ingest_xmltv(f, source, now=None):
+    """Stream XMLTV (plain or gzip) from `f` into epg_channels/programmes; returns (channels, programmes).
+
+    Elements are cleared as soon as they are handled, so memory stays flat whatever the guide size.
+    """
+    now = now or int(time.time())
+    if f.read(2) == b"\x1f\x8b":
+        f.seek(0)
+        f = gzip.GzipFile(fileobj=f)
+    else:
+        f.seek(0)
+    channels, programmes = [], []
+    n_channels = n_programmes = batches = 0
+    root = None
+    for event, elem in ET.iterparse(f, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+        if elem.tag == "programme":
+            start, stop = parse_xmltv_time(elem.get("start")), parse_xmltv_time(elem.get("stop"))
+            channel = elem.get("channel")
+            if channel and start and (stop or start) >= now - EPG_RETENTION and start <= now + EPG_HORIZON:
+                programmes.append((channel, start, stop or start, elem.findtext("title"), elem.findtext("desc"), source))
+        elif elem.tag == "channel":
+            icon = elem.find("icon")
+            channels.append((elem.get("id"), elem.findtext("display-name"), icon.get("src") if icon is not None else None, source))
+        else:
+            continue
+        root.clear()
+        if len(programmes) >= EPG_BATCH:
+            DB_WRITER.executemany("INSERT OR REPLACE INTO programmes(channel, start, stop, title, descr, source) VALUES (?,?,?,?,?,?)", programmes)
+            n_programmes += len(programmes)
+            programmes = []
+            batches += 1
+            # Keep the writer queue (and so memory) bounded when parsing outruns sqlite.
+            if batches % 10 == 0:
+                DB_WRITER.flush()
+        if len(channels) >= EPG_BATCH:
+            DB_WRITER.executemany("INSERT OR REPLACE INTO epg_channels(id, name, icon, source) VALUES (?,?,?,?)", channels)
+            n_channels += len(channels)
+            channels = []
+    DB_WRITER.executemany("INSERT OR REPLACE INTO programmes(channel, start, stop, title, descr, source) VALUES (?,?,?,?,?,?)", programmes)
+    DB_WRITER.executemany("INSERT OR REPLACE INTO epg_channels(id, name, icon, source) VALUES (?,?,?,?)", channels)
+    return n_channels + len(channels), n_programmes + len(programmes)
+
+def epg_file_for(url):
+    # Many guides are all called epg.xml.gz; the URL hash keeps their copies apart.
+    return EPG_DIR / f"{hashlib.sha1(url.encode()).hexdigest()[:12]}_{Path(urlparse(url).path).name or 'epg.xml'}"
+
+def _fetch_epg_source(url, cache):
+    # conditional_get works on a private entry; the new ETag/Last-Modified only
+    # reach `cache` once the guide is ingested, so a failed ingest is retried.
+    pending = {url: cache[url]} if url in cache else {}
+    body, state = conditional_get(url, pending)
+    if not body:
+        cache.update(pending)
+        return state, 0, 0
+    with body:
+        with open(epg_file_for(url), "wb") as f:
+            shutil.copyfileobj(body, f)
+        body.seek(0)
+        counts = ingest_xmltv(body, url)
+    cache.update(pending)
+    return (state,) + counts
+
+def fetch_epg_all(conn):
     EPG_DIR.mkdir(parents=True, exist_ok=True)
-    for u in EPG_SOURCES:
-        try:
-            if u.endswith(".gz"):
-                r = safe_get(u, stream=True)
-                if r:
-                    dest = EPG_DIR / Path(u).name
-                    with open(dest, "wb") as f:
-                        shutil.copyfileobj(r.raw, f)
-            else:
-                r = safe_get(u)
-                if r and r.text:
-                    dest = EPG_DIR / Path(u).name
-                    dest.write_text(r.text, encoding="utf-8")
-        except Exception:
-            pass
+    cache = load_source_cache(conn)
+    started = time.time()
+    totals = {"changed": 0, "channels": 0, "programmes": 0}
+    with ThreadPoolExecutor(max_workers=EPG_WORKERS) as ex:
+        scheduler = OriginScheduler(ex)
+        futures = {scheduler.submit(u, _fetch_epg_source, u, cache): u for u in EPG_SOURCES}
+        for fut in as_completed(futures):
+            try:
+                state, n_channels, n_programmes = fut.result()
+            except Exception as e:
+                log.debug("EPG ingest failed %s -> %s", futures[fut], e)
+                continue
+            totals["changed"] += state == "changed"
+            totals["channels"] += n_channels
+            totals["programmes"] += n_programmes
+    save_source_cache(cache)
+    DB_WRITER.execute("DELETE FROM programmes WHERE stop < ?", (int(time.time()) - EPG_RETENTION,))
+    DB_WRITER.flush()
+    log.info("📺 EPG: %d/%d guides changed, %d channels, %d programmes ingested in %.1fs",
+             totals["changed"], len(EPG_SOURCES), totals["channels"], totals["programmes"], time.time() - started)
 
 def git_push_local():
     try:
@@ -617,46 +2131,79 @@ def git_push_local():
 
 def perform_discovery_and_validation(conn):
     log.info("🔍 Starting discovery: sources + search engines + AI layer")
-    discovered = discover_from_all_sources()
-    discovered.update(discover_with_search_engines("iptv m3u"))
-    ai_new = ai_discover_content()
-    discovered.update(ai_new)
+    source_cache = load_source_cache(conn)
+    repo_paths = load_repo_paths(conn)
+    discovered = discover_from_all_sources(source_cache, repo_paths)
+    save_source_cache(source_cache)
+    save_repo_paths(repo_paths)
+    for url in discover_with_search_engines("iptv m3u"):
+        discovered.setdefault(url, None)
+    for url in ai_discover_content():
+        discovered.setdefault(url, None)
     log.info("Discovered %d total candidates", len(discovered))
-    cur = conn.cursor()
-    for url in discovered:
-        try:
-            cur.execute("INSERT OR IGNORE INTO channels(url, status, last_checked) VALUES (?,?,?)", (url, "new", int(time.time())))
-        except Exception:
-            pass
-    conn.commit()
-    cur.execute("SELECT url, title FROM channels WHERE status IN ('new', 'fail') LIMIT 10000")
-    to_check = cur.fetchall()
-    log.info("Validating %d channels", len(to_check))
+    DEAD_URLS.maybe_rotate()
+    dead = [url for url in discovered if url in DEAD_URLS]
+    for url in dead:
+        del discovered[url]
+    candidates, stats = dedupe_discovered(conn, discovered)
+    stats["dead"] = len(dead)
+    now = int(time.time())
+    DB_WRITER.executemany("INSERT INTO channels(url, title, logo, tvg_id, fingerprint, status, last_checked) VALUES (?,?,?,?,?,?,?) ON CONFLICT(url) DO UPDATE SET title=COALESCE(CASE WHEN channels.title_guessed THEN excluded.title END, channels.title, excluded.title), title_guessed=CASE WHEN excluded.title IS NOT NULL THEN 0 ELSE channels.title_guessed END, logo=COALESCE(channels.logo, excluded.logo), tvg_id=COALESCE(channels.tvg_id, excluded.tvg_id)",
+                          ((url, entry and entry.name, entry and entry.tvg_logo, entry and entry.tvg_id, fp, STATUS_NEW, now) for url, (entry, fp) in candidates.items()))
+    DB_WRITER.flush()
+    title_index = build_title_index(conn)
+    log.info("Title index: %d titles", len(title_index))
+    to_check, seen = [], set()
+    for url, title in select_due_channels(conn, now):
+        if url in DEAD_URLS:
+            stats["due_dead"] = stats.get("due_dead", 0) + 1
+            DB_WRITER.execute("UPDATE channels SET next_check=? WHERE url=?", (now + DEAD_AMNESTY // 2, url))
+            continue
+        fp = url_fingerprint(url)
+        if fp in seen:
+            stats["due_duplicates"] = stats.get("due_duplicates", 0) + 1
+            # Rows stored before fingerprinting: park the extra copy instead of validating it every cycle.
+            DB_WRITER.execute("UPDATE channels SET next_check=? WHERE url=?", (now + RETRY_MAX_INTERVAL, url))
+            continue
+        seen.add(fp)
+        to_check.append((url, title))
+    log.info("🧬 Dedup: %(discovered)d discovered, %(batch_duplicates)d duplicate in batch, %(known_duplicates)d already stored under another URL, %(kept)d kept", stats)
+    if stats["dead"] or stats.get("due_dead"):
+        log.info("🪦 Skipped %d known-dead discovered URLs and parked %d due ones", stats["dead"], stats.get("due_dead", 0))
+    if stats.get("due_duplicates"):
+        log.info("🧬 Dedup: %d equivalent due rows parked", stats["due_duplicates"])
+    log.info("Validating %d due channels", len(to_check))
+    started = time.time()
+    results = asyncio.run(validate_urls_async([url for url, _ in to_check]))
+    log.info("Async validation of %d channels took %.1fs (%d ok)", len(results), time.time() - started, sum(1 for r in results.values() if r[0]))
     with ThreadPoolExecutor(max_workers=WORKER_COUNT) as ex:
-        futures = {ex.submit(validate_and_maybe_replace, conn, url, title): (url, title) for url, title in to_check}
+        futures = {ex.submit(validate_and_maybe_replace, url, title, results.get(url), title_index): (url, title) for url, title in to_check}
         for fut in as_completed(futures):
             try:
                 fut.result()
             except Exception as e:
                 log.debug("Validation task failed: %s", e)
+    DB_WRITER.optimize()
+    DB_WRITER.flush()
+    DEAD_URLS.save()
+    HOST_HEALTH.log_summary()
 
 def main_loop():
     ensure_playlist_header()
     load_existing_playlist_channels()
     conn = init_db()
+    DEAD_URLS.load()
     cycle = 0
     while True:
         try:
             cycle += 1
             log.info("=== AI-REAL-TIME CYCLE START (%d) ===", cycle)
-            fetch_epg_all()
+            fetch_epg_all(conn)
             perform_discovery_and_validation(conn)
-            cur = conn.cursor()
-            cur.execute("SELECT url, title FROM channels WHERE status='ok' LIMIT 10000")
-            rows = cur.fetchall()
-            for url, title in rows:
-                if title:
-                    _ = fetch_metadata_for_title(conn, title)
+            log_http_pool_stats()
+            rows = conn.execute(SQL_OK_CHANNELS, (VALIDATION_BUDGET,)).fetchall()
+            start_metadata_enrichment([title for _, title in rows if title])
+            write_ranked_playlist(conn)
             if LOCAL_PLAYLIST.exists():
                 git_push_local()
             log.info("📊 Total in playlist: %d", len(WRITTEN_CHANNELS))
@@ -669,7 +2216,11 @@ def main_loop():
             time.sleep(60)
 
 if __name__ == '__main__':
+    if "--explain" in sys.argv:
+        explain_hot_queries(init_db())
+        sys.exit(0)
     log.info("🚀 VENGATESH IPTV GOLIATH - AI Continuous Mode")
+    install_dns_cache()
     ensure_playlist_header()
     load_existing_playlist_channels()
     main_loop()